@@ -9,18 +9,22 @@ import re
 import json
 import base64
 import logging
-import time
+import mimetypes
+import threading
+import weakref
 import requests
 import urllib
 
 from collections import namedtuple, OrderedDict
-from urllib.parse import quote_plus
+from multiprocessing.dummy import Pool
+from urllib.parse import quote, quote_plus
 import attr
 
 from utils import (BeautifulSoup, make_coursera_absolute_url,
                     extend_supplement_links, clean_url, clean_filename,
-                    is_debug_run, unescape_html)
-from network import get_reply, get_page, post_page_and_reply
+                    is_debug_run, unescape_html, scan_markup, mkdir_p)
+from network import (get_reply, get_page, get_projected_page,
+                     post_page_and_reply)
 from define import (OPENCOURSE_SUPPLEMENT_URL,
                      OPENCOURSE_PROGRAMMING_ASSIGNMENTS_URL,
                      OPENCOURSE_ASSET_URL,
@@ -28,10 +32,13 @@ from define import (OPENCOURSE_SUPPLEMENT_URL,
                      OPENCOURSE_API_ASSETS_V1_URL,
                      OPENCOURSE_ONDEMAND_COURSE_MATERIALS,
                      OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2,
+                     OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2_LEAN,
                      OPENCOURSE_ONDEMAND_COURSES_V1,
                      OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL,
+                     OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL_LEAN,
                      OPENCOURSE_ONDEMAND_LECTURE_ASSETS_URL,
                      OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1,
+                     OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1_LEAN,
                      OPENCOURSE_MEMBERSHIPS,
                      OPENCOURSE_REFERENCES_POLL_URL,
                      OPENCOURSE_REFERENCE_ITEM_URL,
@@ -41,8 +48,6 @@ from define import (OPENCOURSE_SUPPLEMENT_URL,
                      # New feature, Notebook (Python Jupyter)
                      OPENCOURSE_NOTEBOOK_DESCRIPTIONS,
                      OPENCOURSE_NOTEBOOK_LAUNCHES,
-                     OPENCOURSE_NOTEBOOK_TREE,
-                     OPENCOURSE_NOTEBOOK_DOWNLOAD,
 
                      POST_OPENCOURSE_API_QUIZ_SESSION,
                      POST_OPENCOURSE_API_QUIZ_SESSION_GET_STATE,
@@ -54,10 +59,13 @@ from define import (OPENCOURSE_SUPPLEMENT_URL,
                      INSTRUCTIONS_HTML_INJECTION_AFTER,
 
                      IN_MEMORY_EXTENSION,
-                     IN_MEMORY_MARKER)
+                     IN_MEMORY_MARKER,
+                     IN_MARKUP_MARKER)
 
 
 from cookies import prepare_auth_headers
+from notebooks import NotebookWorkspace
+from filtering import FormatSelector
 
 
 class QuizExamToMarkupConverter(object):
@@ -82,10 +90,25 @@ class QuizExamToMarkupConverter(object):
                          'regex',
                          'reflect')
 
-    def __init__(self, session):
+    def __init__(self, session, render_pool=None):
+        """
+        @param render_pool: Process pool to convert quizzes in, by default
+            quizzes are converted in the calling thread.
+        @type render_pool: multiprocessing.Pool
+        """
         self._session = session
+        self._render_pool = render_pool
 
     def __call__(self, quiz_or_exam_json):
+        if self._render_pool is not None:
+            return self._render_pool.apply(_convert_quiz_to_markup,
+                                           (quiz_or_exam_json,))
+        return self.convert(quiz_or_exam_json)
+
+    def convert(self, quiz_or_exam_json):
+        """
+        Convert quiz/exam JSON into markup. This method makes no requests.
+        """
         result = []
 
         for question_index, question_json in enumerate(quiz_or_exam_json['questions']):
@@ -147,8 +170,8 @@ class QuizExamToMarkupConverter(object):
 
     def _replace_tag(self, text, initial_tag, target_tag):
         soup = BeautifulSoup(text)
-        while soup.find(initial_tag):
-            soup.find(initial_tag).name = target_tag
+        for tag in soup.find_all(initial_tag):
+            tag.name = target_tag
         return soup.prettify()
 
     def _generate_input_field(self):
@@ -156,15 +179,59 @@ class QuizExamToMarkupConverter(object):
                 'name=""><br></label></form>']
 
 
+def _convert_quiz_to_markup(quiz_or_exam_json):
+    """
+    Convert quiz/exam JSON into markup in a worker process.
+    """
+    return QuizExamToMarkupConverter(None).convert(quiz_or_exam_json)
+
+
+def _render_markup(markup, mathjax_cdn_url, sources):
+    """
+    Render markup into HTML in a worker process.
+    """
+    converter = MarkupToHTMLConverter(None, mathjax_cdn_url=mathjax_cdn_url)
+    return converter.render(markup, sources)
+
+
 class MarkupToHTMLConverter(object):
-    def __init__(self, session, mathjax_cdn_url=None):
+    #: Textual markup tags and functions that return names of their HTML
+    #: equivalents
+    TAG_NAMES = {
+        # <text> becomes <p>
+        'text': lambda tag: 'p',
+        # <heading level="1"> becomes <h1>
+        'heading': lambda tag: 'h%s' % tag.attrs.get('level', '1'),
+        # <code> becomes <pre>
+        'code': lambda tag: 'pre',
+        # <list> becomes <ol> or <ul>
+        'list': lambda tag: ('ol' if tag.attrs.get('bullettype', 'numbers')
+                             == 'numbers' else 'ul'),
+    }
+
+    def __init__(self, session, mathjax_cdn_url=None, asset_retriever=None,
+                 render_pool=None, assets_dir=None):
+        """
+        @param render_pool: Process pool to render markup in. Assets are
+            always downloaded in the calling thread, by default markup is
+            rendered there as well.
+        @type render_pool: multiprocessing.Pool
+
+        @param assets_dir: Directory to save images and audios of pages
+            to. Pages refer to the saved files by relative paths. By
+            default (and for pages without file name) images and audios
+            are embedded into pages.
+        @type assets_dir: str
+        """
         self._session = session
-        self._asset_retriever = AssetRetriever(session)
+        self._asset_retriever = asset_retriever or AssetRetriever(session)
         if not mathjax_cdn_url:
             mathjax_cdn_url = INSTRUCTIONS_HTML_MATHJAX_URL
         self._mathjax_cdn_url = mathjax_cdn_url
+        self._render_pool = render_pool
+        self._assets_dir = assets_dir
 
-    def __call__(self, markup):
+    def __call__(self, markup, filename=None):
         """
         Convert instructions markup to make it more suitable for
         offline reading.
@@ -172,29 +239,159 @@ class MarkupToHTMLConverter(object):
         @param markup: HTML (kinda) markup to prettify.
         @type markup: str
 
+        @param filename: File name the page is going to be saved to.
+        @type filename: str
+
         @return: Prettified HTML with several markup tags replaced with HTML
             equivalents.
         @rtype: str
         """
+        sources = self._get_sources(markup, filename)
+        if self._render_pool is not None:
+            return self._render_pool.apply(
+                _render_markup, (markup, self._mathjax_cdn_url, sources))
+        return self.render(markup, sources)
+
+    def render_async(self, markup, callback, filename=None):
+        """
+        Convert instructions markup like __call__, but without waiting for
+        the render pool. Assets are still downloaded before returning.
+
+        @param callback: Callback that will be called with the converted
+            markup, or with the exception that occurred while converting
+            it. It may be called from another thread.
+        @type callback: callable(result) where result may be Exception
+
+        @return: Pending conversion, or None if the markup has been
+            converted already.
+        @rtype: multiprocessing.pool.AsyncResult
+        """
+        sources = self._get_sources(markup, filename)
+        if self._render_pool is not None:
+            return self._render_pool.apply_async(
+                _render_markup, (markup, self._mathjax_cdn_url, sources),
+                callback=callback, error_callback=callback)
+        callback(self.render(markup, sources))
+        return None
+
+    def _get_sources(self, markup, filename):
+        if self._assets_dir is not None and filename is not None:
+            return self._save_assets(markup, os.path.dirname(filename))
+        return self._retrieve_assets(markup)
+
+    def render(self, markup, sources):
+        """
+        Convert instructions markup using assets that have already been
+        downloaded. This method makes no requests.
+
+        @param markup: HTML (kinda) markup to prettify.
+        @type markup: str
+
+        @param sources: Sources of image and audio assets by their ids,
+            @see MarkupToHTMLConverter._retrieve_assets
+        @type sources: {str: (str, str)}
+
+        @return: @see MarkupToHTMLConverter.__call__
+        @rtype: str
+        """
         soup = BeautifulSoup(markup)
-        self._convert_markup_basic(soup)
-        self._convert_markup_images(soup)
-        self._convert_markup_audios(soup)
+        images, audios = self._convert_markup_basic(soup)
+        self._convert_markup_images(images, sources)
+        self._convert_markup_audios(soup, audios, sources)
         return soup.prettify()
 
+    @staticmethod
+    def _get_asset_ids(markup):
+        """
+        Get ids of images and audios of instructions markup.
+        """
+        scan = scan_markup(markup)
+        asset_ids = list(scan.image_asset_ids)
+        asset_ids.extend(tag['id'] for tag in scan.asset_tags
+                         if tag.get('id') is not None and
+                         tag.get('assettype') == 'audio')
+        return asset_ids
+
+    def _retrieve_assets(self, markup):
+        """
+        Download images and audios of instructions markup into memory.
+
+        @return: Sources of downloaded assets by their ids, i.e. tuples of
+            (base64-encoded data URL, content type).
+        @rtype: {str: (str, str)}
+        """
+        asset_ids = self._get_asset_ids(markup)
+        if not asset_ids:
+            return {}
+
+        self._asset_retriever(asset_ids)
+        sources = {}
+        for asset_id in asset_ids:
+            asset = self._asset_retriever[asset_id]
+            if asset.data is not None:
+                encoded64 = base64.b64encode(asset.data).decode()
+                sources[asset_id] = (
+                    'data:%s;base64,%s' % (asset.content_type, encoded64),
+                    asset.content_type)
+        return sources
+
+    def _save_assets(self, markup, page_dir):
+        """
+        Save images and audios of instructions markup to the assets
+        directory.
+
+        @param page_dir: Directory the page is going to be saved to.
+        @type page_dir: str
+
+        @return: Sources of saved assets by their ids, i.e. tuples of
+            (path relative to page_dir, content type).
+        @rtype: {str: (str, str)}
+        """
+        asset_ids = self._get_asset_ids(markup)
+        if not asset_ids:
+            return {}
+
+        filenames = self._asset_retriever.save(asset_ids, self._assets_dir)
+        sources = {}
+        for asset_id, filename in filenames.items():
+            path = os.path.relpath(filename, page_dir).replace(os.sep, '/')
+            sources[asset_id] = (quote(path),
+                                 mimetypes.guess_type(filename)[0])
+        return sources
+
     def _convert_markup_basic(self, soup):
         """
         Perform basic conversion of instructions markup. This includes
         replacement of several textual markup tags with their HTML equivalents.
+        All tags are visited once, images and audios are collected along
+        the way.
 
         @param soup: BeautifulSoup instance.
         @type soup: BeautifulSoup
+
+        @return: Tuple of (images, audios), <img> tags with assetid
+            attribute and audio <asset> tags.
+        @rtype: ([bs4.Tag], [bs4.Tag])
         """
+        images = []
+        audios = []
+        for tag in soup.find_all(True):
+            get_name = self.TAG_NAMES.get(tag.name)
+            if get_name is not None:
+                tag.name = get_name(tag)
+            elif tag.name == 'img':
+                if tag.attrs.get('assetid') is not None:
+                    images.append(tag)
+            elif tag.name == 'asset':
+                if tag.attrs.get('id') is not None and \
+                        tag.attrs.get('assettype') == 'audio':
+                    audios.append(tag)
+
         # Inject meta charset tag
         meta = soup.new_tag('meta', charset='UTF-8')
         soup.insert(0, meta)
 
-        # 1. Inject basic CSS style
+        # Inject basic CSS style
         css = "".join([
             INSTRUCTIONS_HTML_INJECTION_PRE,
             self._mathjax_cdn_url,
@@ -202,80 +399,44 @@ class MarkupToHTMLConverter(object):
         css_soup = BeautifulSoup(css)
         soup.append(css_soup)
 
-        # 2. Replace <text> with <p>
-        while soup.find('text'):
-            soup.find('text').name = 'p'
-
-        # 3. Replace <heading level="1"> with <h1>
-        while soup.find('heading'):
-            heading = soup.find('heading')
-            heading.name = 'h%s' % heading.attrs.get('level', '1')
-
-        # 4. Replace <code> with <pre>
-        while soup.find('code'):
-            soup.find('code').name = 'pre'
-
-        # 5. Replace <list> with <ol> or <ul>
-        while soup.find('list'):
-            list_ = soup.find('list')
-            type_ = list_.attrs.get('bullettype', 'numbers')
-            list_.name = 'ol' if type_ == 'numbers' else 'ul'
+        return images, audios
 
-    def _convert_markup_images(self, soup):
-        """
-        Convert images of instructions markup. Images are downloaded,
-        base64-encoded and inserted into <img> tags.
-
-        @param soup: BeautifulSoup instance.
-        @type soup: BeautifulSoup
+    def _convert_markup_images(self, images, sources):
         """
-        # 6. Replace <img> assets with actual image contents
-        images = [image for image in soup.find_all('img')
-                  if image.attrs.get('assetid') is not None]
-        if not images:
-            return
+        Convert images of instructions markup. Sources of images are
+        inserted into <img> tags.
 
-        # Get assetid attribute from all images
-        asset_ids = [image.attrs.get('assetid') for image in images]
-        self._asset_retriever(asset_ids)
+        @param images: <img> tags with assetid attribute.
+        @type images: [bs4.Tag]
 
+        @param sources: Sources of assets by their ids.
+        @type sources: {str: (str, str)}
+        """
         for image in images:
-            # Encode each image using base64
-            asset = self._asset_retriever[image['assetid']]
-            if asset.data is not None:
-                encoded64 = base64.b64encode(asset.data).decode()
-                image['src'] = 'data:%s;base64,%s' % (
-                    asset.content_type, encoded64)
+            source = sources.get(image['assetid'])
+            if source is not None:
+                image['src'] = source[0]
 
-    def _convert_markup_audios(self, soup):
+    def _convert_markup_audios(self, soup, audios, sources):
         """
-        Convert audios of instructions markup. Audios are downloaded,
-        base64-encoded and inserted as <audio controls> <source> tag.
+        Convert audios of instructions markup. Sources of audios are
+        inserted as <audio controls> <source> tag.
 
         @param soup: BeautifulSoup instance.
         @type soup: BeautifulSoup
-        """
-        # 7. Replace <asset> audio assets with actual audio contents
-        audios = [audio for audio in soup.find_all('asset')
-                  if audio.attrs.get('id') is not None
-                  and audio.attrs.get('assettype') == 'audio']
-        if not audios:
-            return
 
-        # Get assetid attribute from all audios
-        asset_ids = [audio.attrs.get('id') for audio in audios]
-        self._asset_retriever(asset_ids)
+        @param audios: Audio <asset> tags.
+        @type audios: [bs4.Tag]
 
+        @param sources: Sources of assets by their ids.
+        @type sources: {str: (str, str)}
+        """
         for audio in audios:
-            # Encode each audio using base64
-            asset = self._asset_retriever[audio['id']]
-            if asset.data is not None:
-                encoded64 = base64.b64encode(asset.data).decode()
-                data_string = 'data:%s;base64,%s' % (
-                    asset.content_type, encoded64)
-
+            source = sources.get(audio['id'])
+            if source is not None:
+                src, content_type = source
                 source_tag = soup.new_tag(
-                    'source', src=data_string, type=asset.content_type)
+                    'source', src=src, type=content_type)
                 controls_tag = soup.new_tag('audio', controls="")
                 controls_tag.string = 'Your browser does not support the audio element.'
 
@@ -283,6 +444,100 @@ class MarkupToHTMLConverter(object):
                 audio.insert_after(controls_tag)
 
 
+class SessionMetadata(object):
+    """
+    Metadata that does not change during a run: course syllabuses
+    (materials) and memberships of the user. Each of them is fetched at
+    most once per session and shared by the extractor, the API and
+    specialization expansion. Use `SessionMetadata.of` to get the instance
+    of a session.
+    """
+
+    #: Number of course syllabuses kept in memory
+    MAX_SYLLABUSES = 4
+
+    _instances = weakref.WeakKeyDictionary()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, session):
+        # The instance is owned by the session, do not keep it alive
+        self._session_ref = weakref.ref(session)
+        self._lock = threading.Lock()
+        self._syllabuses = OrderedDict()
+        self._memberships = None
+
+    @classmethod
+    def of(cls, session):
+        """
+        Get metadata of a session.
+
+        @param session: Requests session.
+        @type session: requests.Session
+
+        @rtype: SessionMetadata
+        """
+        with cls._instances_lock:
+            metadata = cls._instances.get(session)
+            if metadata is None:
+                metadata = cls(session)
+                cls._instances[session] = metadata
+            return metadata
+
+    def get_syllabus(self, class_name):
+        """
+        Get reply of OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2 for a course.
+
+        @param class_name: Course name (slug).
+        @type class_name: str
+
+        @rtype: dict
+        """
+        with self._lock:
+            dom = self._syllabuses.get(class_name)
+            if dom is None:
+                page = get_projected_page(
+                    self._session_ref(),
+                    OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2_LEAN,
+                    OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2,
+                    class_name=class_name)
+                logging.debug('Downloaded syllabus of %s (%d bytes)',
+                              class_name, len(page))
+                dom = json.loads(page)
+
+                self._syllabuses[class_name] = dom
+                if len(self._syllabuses) > self.MAX_SYLLABUSES:
+                    self._syllabuses.popitem(last=False)
+            return dom
+
+    def get_memberships(self):
+        """
+        Get reply of OPENCOURSE_MEMBERSHIPS.
+
+        @rtype: dict
+        """
+        with self._lock:
+            if self._memberships is None:
+                self._memberships = get_page(
+                    self._session_ref(), OPENCOURSE_MEMBERSHIPS, json=True)
+            return self._memberships
+
+    def get_user_id(self):
+        """
+        @return: Id of the user or None if the user has no memberships.
+        @rtype: int or None
+        """
+        elements = self.get_memberships()['elements']
+        return elements[0]['userId'] if elements else None
+
+    def get_enrolled_courses(self):
+        """
+        @return: Names (slugs) of enrolled courses.
+        @rtype: [str]
+        """
+        return [element['slug'] for element
+                in self.get_memberships()['linked']['courses.v1']]
+
+
 class OnDemandCourseMaterialItemsV1(object):
     """
     Helper class that allows accessing lecture JSONs by lesson IDs.
@@ -314,9 +569,7 @@ class OnDemandCourseMaterialItemsV1(object):
         @rtype: OnDemandCourseMaterialItems
         """
 
-        dom = get_page(session, OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2,
-                       json=True,
-                       class_name=course_name)
+        dom = SessionMetadata.of(session).get_syllabus(course_name)
         return OnDemandCourseMaterialItemsV1(
             dom['linked']['onDemandCourseMaterialItems.v2'])
 
@@ -363,54 +616,400 @@ class Asset(namedtuple('Asset', 'id name type_name url content_type data')):
             self.id, self.name, self.type_name, self.url, self.content_type)
 
 
+class AssetResolver(object):
+    """
+    This class resolves asset ids of a course into their descriptions. Ids
+    are requested in batches and every description is memoized, so that
+    each id is requested at most once per course, even if it is shared by
+    several lectures or requested from several threads at once.
+    """
+
+    #: Maximum number of ids to request at once
+    BATCH_SIZE = 50
+
+    def __init__(self, session):
+        self._session = session
+        self._lock = threading.Lock()
+        # Map of "asset id => threading.Event" for ids being requested
+        self._pending = {}
+
+        # Maps of "asset id => element JSON", None for ids that could
+        # not be resolved
+        self._open_course_assets = {}
+        self._assets = {}
+        self._asset_urls = {}
+
+        self._batch_open_course_assets = True
+
+    def remember_open_course_asset(self, asset_id, element):
+        """
+        Store openCourseAssets.v1 element that came as a part of another
+        reply (e.g. `linked` section), so that it is not requested again.
+
+        @param asset_id: Open course asset ID.
+        @type asset_id: str
+
+        @param element: openCourseAssets.v1 element JSON.
+        @type element: dict
+        """
+        if 'typeName' not in element or 'definition' not in element:
+            return
+
+        with self._lock:
+            self._open_course_assets[asset_id] = element
+
+    def get_open_course_assets(self, asset_ids):
+        """
+        Get openCourseAssets.v1 elements (see OPENCOURSE_ASSETS_URL).
+
+        @param asset_ids: List of open course asset ids.
+        @type asset_ids: [str]
+
+        @return: Map of "asset id => element JSON" for resolved ids, in the
+            order of asset_ids.
+        @rtype: OrderedDict
+        """
+        return self._resolve(self._open_course_assets, asset_ids,
+                             self._fetch_open_course_assets)
+
+    def get_assets(self, asset_ids):
+        """
+        Get assets.v1 elements (see OPENCOURSE_API_ASSETS_V1_URL).
+
+        @param asset_ids: List of asset ids.
+        @type asset_ids: [str]
+
+        @return: Map of "asset id => element JSON" for resolved ids, in the
+            order of asset_ids.
+        @rtype: OrderedDict
+        """
+        return self._resolve(self._assets, asset_ids, self._fetch_assets)
+
+    def get_asset_urls(self, asset_ids):
+        """
+        Get assetUrls.v1 elements (see OPENCOURSE_ASSET_URL).
+
+        @param asset_ids: List of asset ids.
+        @type asset_ids: [str]
+
+        @return: Map of "asset id => element JSON" for resolved ids, in the
+            order of asset_ids.
+        @rtype: OrderedDict
+        """
+        return self._resolve(self._asset_urls, asset_ids,
+                             self._fetch_asset_urls)
+
+    def _resolve(self, memo, asset_ids, fetch):
+        asset_ids = list(OrderedDict.fromkeys(asset_ids))
+
+        with self._lock:
+            missing = [asset_id for asset_id in asset_ids
+                       if asset_id not in memo and
+                       asset_id not in self._pending]
+            waiting = set(self._pending[asset_id] for asset_id in asset_ids
+                          if asset_id in self._pending)
+            done = threading.Event()
+            for asset_id in missing:
+                self._pending[asset_id] = done
+
+        try:
+            for start in range(0, len(missing), self.BATCH_SIZE):
+                batch = missing[start:start + self.BATCH_SIZE]
+                elements = fetch(batch)
+                with self._lock:
+                    for element in elements:
+                        memo[element['id']] = element
+                    for asset_id in batch:
+                        memo.setdefault(asset_id, None)
+        finally:
+            with self._lock:
+                for asset_id in missing:
+                    del self._pending[asset_id]
+            done.set()
+
+        if waiting:
+            # Some ids were being requested by other threads. Once they are
+            # done, try again: ids that they failed to get are requested
+            # by this thread.
+            for event in waiting:
+                event.wait()
+            return self._resolve(memo, asset_ids, fetch)
+
+        with self._lock:
+            return OrderedDict((asset_id, memo[asset_id])
+                               for asset_id in asset_ids
+                               if memo.get(asset_id) is not None)
+
+    def _fetch_open_course_assets(self, asset_ids):
+        if self._batch_open_course_assets or len(asset_ids) == 1:
+            try:
+                dom = get_page(self._session, OPENCOURSE_ASSETS_URL,
+                               json=True, id=','.join(asset_ids))
+                return dom['elements']
+            except requests.exceptions.HTTPError as e:
+                if len(asset_ids) == 1:
+                    raise
+                logging.debug('Could not get open course assets %s in one '
+                              'request, requesting them one by one: %s',
+                              asset_ids, e)
+                self._batch_open_course_assets = False
+
+        elements = []
+        for asset_id in asset_ids:
+            dom = get_page(self._session, OPENCOURSE_ASSETS_URL,
+                           json=True, id=asset_id)
+            elements.extend(dom['elements'])
+        return elements
+
+    def _fetch_assets(self, asset_ids):
+        dom = get_page(self._session, OPENCOURSE_API_ASSETS_V1_URL,
+                       json=True,
+                       id=','.join(asset_ids))
+        return dom['elements']
+
+    def _fetch_asset_urls(self, asset_ids):
+        dom = get_page(self._session, OPENCOURSE_ASSET_URL,
+                       json=True,
+                       ids=quote_plus(','.join(asset_ids)))
+        return dom['elements']
+
+
 class AssetRetriever(object):
     """
     This class helps download assets by their ID.
     """
 
-    def __init__(self, session):
+    #: Maximum number of assets of a batch that are downloaded in parallel
+    DOWNLOAD_JOBS = 4
+
+    #: Number of seconds to wait for the server when downloading an asset
+    DOWNLOAD_TIMEOUT = 60
+
+    def __init__(self, session, asset_resolver=None):
         self._session = session
+        self._asset_resolver = asset_resolver or AssetResolver(session)
         self._asset_mapping = {}
+        self._saved_assets = {}
+        # Events of assets that are being downloaded by some thread
+        self._downloads = {}
+        # Retriever may be shared by several extraction threads
+        self._lock = threading.Lock()
 
     def __getitem__(self, asset_id):
-        return self._asset_mapping[asset_id]
+        with self._lock:
+            return self._asset_mapping[asset_id]
 
     def __call__(self, asset_ids, download=True):
-        result = []
+        """
+        Get assets by their ids. Contents of assets of a batch are
+        downloaded in parallel. Assets that could not be downloaded have
+        no data.
 
-        # Download information about assets (by IDs)
-        asset_list = get_page(self._session, OPENCOURSE_API_ASSETS_V1_URL,
-                              json=True,
-                              id=','.join(asset_ids))
+        @param asset_ids: Ids of assets.
+        @type asset_ids: [str]
 
-        # Create a map "asset_id => asset" for easier access
-        asset_map = dict((asset['id'], asset)
-                         for asset in asset_list['elements'])
+        @param download: Whether contents of assets should be downloaded.
+        @type download: bool
 
-        for asset_id in asset_ids:
-            # Download each asset
-            asset_dict = asset_map[asset_id]
-
-            url = asset_dict['url']['url'].strip()
-            data, content_type = None, None
+        @return: Assets in the order of asset_ids.
+        @rtype: [Asset]
+        """
+        # Get information about assets (by IDs)
+        asset_map = self._asset_resolver.get_assets(asset_ids)
+
+        # Assets that are shared by several pages are downloaded once,
+        # even if the pages are extracted by different threads
+        new_ids = []
+        downloads = []
+        with self._lock:
+            for asset_id in OrderedDict.fromkeys(asset_ids):
+                asset = self._asset_mapping.get(asset_id)
+                if asset is not None and (asset.data is not None or
+                                          not download):
+                    continue
+                if asset_id in self._downloads:
+                    # Even without download, wait for the asset, so that
+                    # it does not replace the one being downloaded
+                    downloads.append(self._downloads[asset_id])
+                    continue
+
+                new_ids.append(asset_id)
+                if download:
+                    self._downloads[asset_id] = threading.Event()
+
+        def get_asset(asset_id):
+            return self._get_asset(asset_map[asset_id], download)
 
+        try:
             if download:
-                reply = get_reply(self._session, url)
+                assets = self._map(get_asset, new_ids)
+            else:
+                assets = [get_asset(asset_id) for asset_id in new_ids]
+
+            with self._lock:
+                for asset_id, asset in zip(new_ids, assets):
+                    # Never lose data of an asset downloaded meanwhile
+                    known_asset = self._asset_mapping.get(asset_id)
+                    if known_asset is None or known_asset.data is None:
+                        self._asset_mapping[asset_id] = asset
+        finally:
+            with self._lock:
+                for asset_id in new_ids:
+                    event = self._downloads.pop(asset_id, None)
+                    if event is not None:
+                        event.set()
+
+        for event in downloads:
+            event.wait()
+
+        with self._lock:
+            return [self._asset_mapping[asset_id] for asset_id in asset_ids]
+
+    def _map(self, function, items):
+        """
+        Call function for every item using up to DOWNLOAD_JOBS threads.
+
+        @return: Results in the order of items.
+        @rtype: list
+        """
+        if len(items) < 2:
+            return [function(item) for item in items]
+
+        pool = Pool(processes=min(self.DOWNLOAD_JOBS, len(items)))
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _get_asset(self, asset_dict, download):
+        """
+        Create asset from its description, downloading its contents if
+        requested.
+
+        @rtype: Asset
+        """
+        url = asset_dict['url']['url'].strip()
+        data, content_type = None, None
+
+        if download:
+            try:
+                reply = get_reply(self._session, url,
+                                  timeout=self.DOWNLOAD_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                logging.warning('Could not download asset %s: %s', url, e)
+            else:
                 if reply.status_code == 200:
                     data = reply.content
                     content_type = reply.headers.get('Content-Type')
 
-            asset = Asset(id=asset_dict['id'].strip(),
-                          name=asset_dict['name'].strip(),
-                          type_name=asset_dict['typeName'].strip(),
-                          url=url,
-                          content_type=content_type,
-                          data=data)
+        return Asset(id=asset_dict['id'].strip(),
+                     name=asset_dict['name'].strip(),
+                     type_name=asset_dict['typeName'].strip(),
+                     url=url,
+                     content_type=content_type,
+                     data=data)
 
-            self._asset_mapping[asset.id] = asset
-            result.append(asset)
+    def save(self, asset_ids, directory):
+        """
+        Download assets into files of a directory. Files are streamed to
+        disk and named after asset ids, so that an asset used by several
+        pages is downloaded once and is not kept in memory. Assets of a
+        batch are downloaded in parallel.
 
-        return result
+        @param asset_ids: Ids of assets to save.
+        @type asset_ids: [str]
+
+        @param directory: Directory to save assets to.
+        @type directory: str
+
+        @return: File names of saved assets by their ids. Assets that could
+            not be downloaded are left out.
+        @rtype: {str: str}
+        """
+        saved_assets = self._get_saved_assets(directory)
+        filenames = {}
+        missing_ids = []
+        for asset_id in asset_ids:
+            filename = saved_assets.get(clean_filename(asset_id))
+            if filename is None:
+                missing_ids.append(asset_id)
+            else:
+                filenames[asset_id] = filename
+
+        if not missing_ids:
+            return filenames
+
+        mkdir_p(directory)
+        asset_map = self._asset_resolver.get_assets(missing_ids)
+
+        def save_asset(asset_id):
+            asset_dict = asset_map[asset_id]
+            url = asset_dict['url']['url'].strip()
+            _, extension = os.path.splitext(asset_dict['name'].strip())
+            filename = os.path.join(
+                directory, clean_filename(asset_id) + extension)
+            return filename if self._save_asset(url, filename) else None
+
+        missing_ids = list(OrderedDict.fromkeys(missing_ids))
+        for asset_id, filename in zip(missing_ids,
+                                      self._map(save_asset, missing_ids)):
+            if filename is not None:
+                filenames[asset_id] = filename
+                with self._lock:
+                    saved_assets[clean_filename(asset_id)] = filename
+
+        return filenames
+
+    def _get_saved_assets(self, directory):
+        """
+        Get files of assets that have already been saved to a directory.
+        The directory is listed only once.
+
+        @return: File names by asset file names without extensions.
+        @rtype: {str: str}
+        """
+        with self._lock:
+            saved_assets = self._saved_assets.get(directory)
+            if saved_assets is None:
+                saved_assets = {}
+                if os.path.isdir(directory):
+                    for filename in os.listdir(directory):
+                        name, extension = os.path.splitext(filename)
+                        if extension != '.tmp':
+                            saved_assets[name] = os.path.join(
+                                directory, filename)
+                self._saved_assets[directory] = saved_assets
+            return saved_assets
+
+    def _save_asset(self, url, filename):
+        """
+        Stream an asset into a file. The file is written under a temporary
+        name first, so that an interrupted download is not mistaken for a
+        saved asset.
+
+        @return: True if the asset has been saved.
+        @rtype: bool
+        """
+        temp_filename = '%s.%s.tmp' % (
+            filename, threading.current_thread().ident)
+        try:
+            with self._session.get(url, stream=True,
+                                   timeout=self.DOWNLOAD_TIMEOUT) as reply:
+                if reply.status_code != 200:
+                    logging.warning('Could not download asset %s: HTTP %s',
+                                    url, reply.status_code)
+                    return False
+                with open(temp_filename, 'wb') as file_object:
+                    for chunk in reply.iter_content(chunk_size=65536):
+                        file_object.write(chunk)
+            os.replace(temp_filename, filename)
+            return True
+        except (requests.exceptions.RequestException, IOError) as e:
+            logging.warning('Could not download asset %s: %s', url, e)
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            return False
 
 
 @attr.s
@@ -541,27 +1140,95 @@ class VideosV1(object):
         return next(iter(self.children.values()))
 
 
-def expand_specializations(session, class_names):
+#: Number of specializations that are looked up in parallel
+SPECIALIZATION_JOBS = 8
+
+
+def expand_specializations(session, class_names, cache=None):
     """
     Checks whether any given name is not a class but a specialization.
 
     If it's a specialization, expand the list of class names with the child
-    class names.
+    class names. Names are looked up in parallel.
+
+    @param cache: Cache of lookups. Names found in the cache are not
+        looked up, new results are stored there.
+    @type cache: specializationcache.SpecializationCache
     """
+    children = {}
+    if cache is not None:
+        for class_name in class_names:
+            known, class_children = cache.get(class_name)
+            if known:
+                children[class_name] = class_children
+
+    unknown_names = [class_name
+                     for class_name in OrderedDict.fromkeys(class_names)
+                     if class_name not in children]
+    if unknown_names:
+        # Enrolled courses are known not to be specializations
+        try:
+            enrolled_courses = set(
+                SessionMetadata.of(session).get_enrolled_courses())
+        except requests.exceptions.HTTPError as e:
+            logging.debug('Could not list enrolled courses: %s', e)
+            enrolled_courses = set()
+
+        def look_up(class_name):
+            if class_name in enrolled_courses:
+                return None, True
+            return _look_up_specialization(session, class_name)
+
+        pool = Pool(processes=min(SPECIALIZATION_JOBS, len(unknown_names)))
+        try:
+            lookups = pool.map(look_up, unknown_names)
+        finally:
+            pool.close()
+            pool.join()
+
+        for class_name, (class_children, definite) in zip(unknown_names,
+                                                          lookups):
+            children[class_name] = class_children
+            if cache is not None and definite:
+                cache.put(class_name, class_children)
+
+        if cache is not None:
+            cache.save()
+
     result = []
     for class_name in class_names:
-        specialization = SpecializationV1.create(session, class_name)
-        if specialization is None:
+        if children[class_name] is None:
             result.append(class_name)
         else:
-            result.extend(specialization.children)
+            result.extend(children[class_name])
             logging.info('Expanded specialization "%s" into the following'
                          ' classes: %s',
-                         class_name, ' '.join(specialization.children))
+                         class_name, ' '.join(children[class_name]))
 
     return result
 
 
+def _look_up_specialization(session, class_name):
+    """
+    Look up courses of a specialization.
+
+    @return: Tuple of (list, bool), the list contains courses of the
+        specialization or is None if the name is not a specialization, the
+        bool tells whether the answer is definite, i.e. the lookup has not
+        failed because of a network or server error.
+    @rtype: ([str], bool)
+    """
+    try:
+        return SpecializationV1.fetch(session, class_name).children, True
+    except requests.exceptions.HTTPError as e:
+        logging.debug('Could not expand %s: %s', class_name, e)
+        status_code = getattr(e.response, 'status_code', None)
+        return None, status_code is not None and 400 <= status_code < 500
+    except requests.exceptions.RequestException as e:
+        logging.debug('Could not expand %s: %s', class_name, e)
+        return None, False
+
+
 @attr.s
 class SpecializationV1(object):
     children = attr.ib()
@@ -569,13 +1236,22 @@ class SpecializationV1(object):
     @staticmethod
     def create(session, class_name):
         try:
-            dom = get_page(session, OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1,
-                           json=True, quiet=True,
-                           class_name=class_name)
+            return SpecializationV1.fetch(session, class_name)
         except requests.exceptions.HTTPError as e:
             logging.debug('Could not expand %s: %s', class_name, e)
             return None
 
+    @staticmethod
+    def fetch(session, class_name):
+        """
+        Same as create, but raises HTTPError if class_name is not a
+        specialization or the lookup has failed.
+        """
+        dom = get_projected_page(
+            session, OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1_LEAN,
+            OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1,
+            json=True, quiet=True, class_name=class_name)
+
         return SpecializationV1(
             [course['slug'] for course in dom['linked']['courses.v1']])
 
@@ -590,7 +1266,12 @@ class CourseraOnDemand(object):
 
     def __init__(self, session, course_id, course_name,
                  unrestricted_filenames=False,
-                 mathjax_cdn_url=None):
+                 mathjax_cdn_url=None,
+                 format_selector=None,
+                 render_pool=None,
+                 defer_rendering=False,
+                 page_store=None,
+                 overwrite=False):
         """
         Initialize Coursera OnDemand API.
 
@@ -604,6 +1285,27 @@ class CourseraOnDemand(object):
             file names should endure stricter character filtering. @see
             `clean_filename` for the details.
         @type unrestricted_filenames: bool
+
+        @param format_selector: Formats that are going to be downloaded,
+            links of other formats may be left out. By default links of
+            all formats are extracted.
+        @type format_selector: filtering.FormatSelector
+
+        @param render_pool: Process pool to render quizzes and instructions
+            in. By default they are rendered in the calling thread.
+        @type render_pool: multiprocessing.Pool
+
+        @param defer_rendering: Whether pages should be left as markup
+            (IN_MARKUP_MARKER) to be rendered only when they are saved.
+        @type defer_rendering: bool
+
+        @param page_store: Store to keep contents of pages in, links will
+            only refer to them. By default pages are kept in links.
+        @type page_store: pagestore.PageStore
+
+        @param overwrite: Whether notebook files that differ from the
+            workspace should be replaced, @see notebooks.NotebookWorkspace.
+        @type overwrite: bool
         """
         self._session = session
         self._notebook_cookies = None
@@ -612,17 +1314,25 @@ class CourseraOnDemand(object):
 
         self._unrestricted_filenames = unrestricted_filenames
         self._user_id = None
-
-        self._quiz_to_markup = QuizExamToMarkupConverter(session)
+        self._format_selector = format_selector or FormatSelector()
+        self._defer_rendering = defer_rendering
+        self._page_store = page_store
+        self._overwrite = overwrite
+
+        # Assets are resolved and downloaded once for the whole course
+        self._asset_resolver = AssetResolver(session)
+        self._asset_retriever = AssetRetriever(
+            session, asset_resolver=self._asset_resolver)
+
+        self._quiz_to_markup = QuizExamToMarkupConverter(
+            session, render_pool=render_pool)
         self._markup_to_html = MarkupToHTMLConverter(
-            session, mathjax_cdn_url=mathjax_cdn_url)
-        self._asset_retriever = AssetRetriever(session)
+            session, mathjax_cdn_url=mathjax_cdn_url,
+            asset_retriever=self._asset_retriever,
+            render_pool=render_pool)
 
     def obtain_user_id(self):
-        reply = get_page(self._session, OPENCOURSE_MEMBERSHIPS, json=True)
-        elements = reply['elements']
-        user_id = elements[0]['userId'] if elements else None
-        self._user_id = user_id
+        self._user_id = SessionMetadata.of(self._session).get_user_id()
 
     def list_courses(self):
         """
@@ -631,10 +1341,7 @@ class CourseraOnDemand(object):
         @return: List of enrolled courses.
         @rtype: [str]
         """
-        reply = get_page(self._session, OPENCOURSE_MEMBERSHIPS, json=True)
-        course_list = reply['linked']['courses.v1']
-        slugs = [element['slug'] for element in course_list]
-        return slugs
+        return SessionMetadata.of(self._session).get_enrolled_courses()
 
     def extract_links_from_exam(self, exam_id):
         try:
@@ -648,92 +1355,6 @@ class CourseraOnDemand(object):
                     'Could not download exam %s: %s', exam_id, exception)
             return None
 
-    def _get_notebook_folder(self, url, jupyterId, **kwargs):
-
-        supplement_links = {}
-
-        url = url.format(**kwargs)
-        reply = get_page(self._session, url, json=True)
-
-        for content in reply['content']:
-
-            if content['type'] == 'directory':
-                a = self._get_notebook_folder(
-                    OPENCOURSE_NOTEBOOK_TREE, jupyterId, jupId=jupyterId,
-                    path=content['path'], timestamp=int(time.time()))
-                supplement_links.update(a)
-
-            elif content['type'] == 'file':
-                tmp_url = OPENCOURSE_NOTEBOOK_DOWNLOAD.format(
-                    path=content['path'], jupId=jupyterId,
-                    timestamp=int(time.time()))
-                filename, extension = os.path.splitext(clean_url(tmp_url))
-
-                head, tail = os.path.split(content['path'])
-                # '/' in the following line is for a reason:
-                # @noureddin says: "I split head using split('/') not
-                # os.path.split() because it's seems to me that it comes from a
-                # web page, so the separator will always be /, so using the
-                # native path splitting function is not the most portable
-                # way to do it."
-                # Original pull request:
-                # https://github.com/coursera-dl/coursera-dl/pull/654
-                head = '/'.join([clean_filename(dir, minimal_change=True)
-                                 for dir in head.split('/')])
-                tail = clean_filename(tail, minimal_change=True)
-
-                if not os.path.isdir(self._course_name + "/notebook/" + head + "/"):
-                    logging.info('Creating [%s] directories...', head)
-                    os.makedirs(self._course_name + "/notebook/" + head + "/")
-
-                r = requests.get(tmp_url.replace(" ", "%20"),
-                                 cookies=self._session.cookies)
-                if not os.path.exists(self._course_name + "/notebook/" + head + "/" + tail):
-                    logging.info('Downloading %s into %s', tail, head)
-                    with open(self._course_name + "/notebook/" + head + "/" + tail, 'wb+') as f:
-                        f.write(r.content)
-                else:
-                    logging.info('Skipping %s... (file exists)', tail)
-
-                if str(extension[1:]) not in supplement_links:
-                    supplement_links[str(extension[1:])] = []
-
-                supplement_links[str(extension[1:])].append(
-                    (tmp_url.replace(" ", "%20"), filename))
-
-            elif content['type'] == 'notebook':
-                tmp_url = OPENCOURSE_NOTEBOOK_DOWNLOAD.format(
-                    path=content['path'], jupId=jupyterId, timestamp=int(time.time()))
-                filename, extension = os.path.splitext(clean_url(tmp_url))
-
-                head, tail = os.path.split(content['path'])
-
-                if not os.path.isdir(self._course_name + "/notebook/" + head + "/"):
-                    logging.info('Creating [%s] directories...', head)
-                    os.makedirs(self._course_name + "/notebook/" + head + "/")
-
-                r = requests.get(tmp_url.replace(" ", "%20"),
-                                 cookies=self._session.cookies)
-                if not os.path.exists(self._course_name + "/notebook/" + head + "/" + tail):
-                    logging.info(
-                        'Downloading Jupyter %s into %s', tail, head)
-                    with open(self._course_name + "/notebook/" + head + "/" + tail, 'wb+') as f:
-                        f.write(r.content)
-                else:
-                    logging.info('Skipping %s... (file exists)', tail)
-
-                if "ipynb" not in supplement_links:
-                    supplement_links["ipynb"] = []
-
-                supplement_links["ipynb"].append(
-                    (tmp_url.replace(" ", "%20"), filename))
-
-            else:
-                logging.info(
-                    'Unsupported typename %s in notebook', content['type'])
-
-        return supplement_links
-
     def _get_notebook_json(self, notebook_id, authorizationId):
 
         headers = self._auth_headers_with_json()
@@ -752,14 +1373,10 @@ class CourseraOnDemand(object):
 
         jupyted_id = jupyted_id[0]
 
-        newReq = requests.Session()
-        req = newReq.get(OPENCOURSE_NOTEBOOK_TREE.format(
-            jupId=jupyted_id, path="/", timestamp=int(time.time())),
-            headers=headers)
-
-        return self._get_notebook_folder(
-            OPENCOURSE_NOTEBOOK_TREE, jupyted_id, jupId=jupyted_id,
-            path="/", timestamp=int(time.time()))
+        workspace = NotebookWorkspace(
+            self._session, self._course_name, jupyted_id,
+            overwrite=self._overwrite)
+        return workspace.sync()
 
     def extract_links_from_notebook(self, notebook_id):
 
@@ -789,12 +1406,9 @@ class CourseraOnDemand(object):
 
     def _convert_quiz_json_to_links(self, quiz_json, filename_suffix):
         markup = self._quiz_to_markup(quiz_json)
-        html = self._markup_to_html(markup)
 
         supplement_links = {}
-        instructions = (IN_MEMORY_MARKER + html, filename_suffix)
-        extend_supplement_links(
-            supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
+        self._extend_with_html(supplement_links, markup, filename_suffix)
         return supplement_links
 
     def _get_exam_json(self, exam_id, session_id):
@@ -876,14 +1490,21 @@ class CourseraOnDemand(object):
 
         @return: @see CourseraOnDemand._extract_links_from_text
         """
+        selector = self._format_selector
         try:
-            links = self._extract_videos_and_subtitles_from_lecture(
-                course_id, video_id, subtitle_language, resolution)
-
-            assets = self._get_lecture_asset_ids(course_id, video_id)
-            assets = self._normalize_assets(assets)
-            extend_supplement_links(
-                links, self._extract_links_from_lecture_assets(assets))
+            links = {}
+            if selector.wants('mp4') or selector.wants_suffix('srt') or \
+                    selector.wants_suffix('txt'):
+                links = self._extract_videos_and_subtitles_from_lecture(
+                    course_id, video_id, subtitle_language, resolution)
+
+            # Lecture assets may be of any format, they are not looked up
+            # only if nothing but subtitles is going to be downloaded
+            if not selector.wants_only_subtitles():
+                assets = self._get_lecture_asset_ids(course_id, video_id)
+                assets = self._normalize_assets(assets)
+                extend_supplement_links(
+                    links, self._extract_links_from_lecture_assets(assets))
 
             return links
         except requests.exceptions.HTTPError as exception:
@@ -900,10 +1521,17 @@ class CourseraOnDemand(object):
         """
         dom = get_page(self._session, OPENCOURSE_ONDEMAND_LECTURE_ASSETS_URL,
                        json=True, course_id=course_id, video_id=video_id)
+        open_course_assets = dom['linked']['openCourseAssets.v1']
+
+        # The reply already includes the open course assets, remember them
+        # so that they are not requested once again one by one
+        for asset in open_course_assets:
+            asset_id, = self._normalize_assets([asset['id']])
+            self._asset_resolver.remember_open_course_asset(asset_id, asset)
+
         # Note that we extract here "id", not definition -> assetId, as it
         # be extracted later.
-        return [asset['id']
-                for asset in dom['linked']['openCourseAssets.v1']]
+        return [asset['id'] for asset in open_course_assets]
 
     def _normalize_assets(self, assets):
         """
@@ -959,6 +1587,15 @@ class CourseraOnDemand(object):
                 destination[extension] = []
             destination[extension].append((url, basename))
 
+        # Resolve all assets of the lecture at once, so that the following
+        # calls to _get_asset_urls are served from memory
+        open_course_assets = self._asset_resolver.get_open_course_assets(
+            asset_ids)
+        self._asset_resolver.get_assets(
+            [element['definition']['assetId']
+             for element in open_course_assets.values()
+             if element['typeName'] == 'asset'])
+
         for asset_id in asset_ids:
             for asset in self._get_asset_urls(asset_id):
                 _add_asset(asset['name'], asset['url'], links)
@@ -968,7 +1605,7 @@ class CourseraOnDemand(object):
     def _get_asset_urls(self, asset_id):
         """
         Get list of asset urls and file names. This method may internally
-        use AssetRetriever to extract `asset` element types.
+        use AssetResolver to extract `asset` element types.
 
         @param asset_id: Asset ID.
         @type asset_id: str
@@ -979,13 +1616,13 @@ class CourseraOnDemand(object):
             'url': '<url>'
         }]
         """
-        dom = get_page(self._session, OPENCOURSE_ASSETS_URL,
-                       json=True, id=asset_id)
+        elements = list(
+            self._asset_resolver.get_open_course_assets([asset_id]).values())
         logging.debug('Parsing JSON for asset_id <%s>.', asset_id)
 
         urls = []
 
-        for element in dom['elements']:
+        for element in elements:
             typeName = element['typeName']
             definition = element['definition']
 
@@ -1023,7 +1660,7 @@ class CourseraOnDemand(object):
                     'If you think the downloader missed some '
                     'files, please report the issue here:\n'
                     'https://github.com/coursera-dl/coursera-dl/issues/new',
-                    typeName, json.dumps(dom, indent=4))
+                    typeName, json.dumps(element, indent=4))
 
         return urls
 
@@ -1035,10 +1672,12 @@ class CourseraOnDemand(object):
 
         logging.debug('Parsing JSON for video_id <%s>.', video_id)
 
-        dom = get_page(self._session, OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL,
-                       json=True,
-                       course_id=course_id,
-                       video_id=video_id)
+        dom = get_projected_page(self._session,
+                                 OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL_LEAN,
+                                 OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL,
+                                 json=True,
+                                 course_id=course_id,
+                                 video_id=video_id)
         dom = dom['linked']['onDemandVideos.v1'][0]
 
         videos = VideosV1.from_json(dom)
@@ -1081,6 +1720,8 @@ class CourseraOnDemand(object):
         subtitle_links = {}
         for (subtitle_node, subtitle_extension, subtitle_description) \
                 in subtitle_nodes:
+            if not self._format_selector.wants_suffix(subtitle_extension):
+                continue
             logging.debug('Gathering %s URLs for video_id <%s>.',
                           subtitle_description, video_id)
             subtitles = video_dom.get(subtitle_node)
@@ -1153,10 +1794,7 @@ class CourseraOnDemand(object):
                 return {}
 
             supplement_links = self._extract_links_from_text(text)
-            instructions = (IN_MEMORY_MARKER + self._markup_to_html(text),
-                            'instructions')
-            extend_supplement_links(
-                supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
+            self._extend_with_html(supplement_links, text, 'instructions')
             return supplement_links
         except requests.exceptions.HTTPError as exception:
             logging.error('Could not download programming assignment %s: %s',
@@ -1187,10 +1825,7 @@ class CourseraOnDemand(object):
                 return {}
 
             supplement_links = self._extract_links_from_text(text)
-            instructions = (IN_MEMORY_MARKER + self._markup_to_html(text),
-                            'instructions')
-            extend_supplement_links(
-                supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
+            self._extend_with_html(supplement_links, text, 'instructions')
             return supplement_links
         except requests.exceptions.HTTPError as exception:
             logging.error('Could not download programming assignment %s: %s',
@@ -1221,10 +1856,8 @@ class CourseraOnDemand(object):
                 return {}
 
             supplement_links = self._extract_links_from_text(text)
-            instructions = (IN_MEMORY_MARKER + self._markup_to_html(text),
-                            'peer_assignment_instructions')
-            extend_supplement_links(
-                supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
+            self._extend_with_html(supplement_links, text,
+                                   'peer_assignment_instructions')
             return supplement_links
         except requests.exceptions.HTTPError as exception:
             logging.error('Could not download peer assignment %s: %s',
@@ -1258,6 +1891,7 @@ class CourseraOnDemand(object):
             #       'definition' {
             #           'value'
 
+            self._prefetch_asset_urls(dom['linked']['openCourseAssets.v1'])
             for asset in dom['linked']['openCourseAssets.v1']:
                 value = asset['definition']['value']
                 # Supplement lecture types are known to contain both <asset> tags
@@ -1266,10 +1900,8 @@ class CourseraOnDemand(object):
                 extend_supplement_links(
                     supplement_content, self._extract_links_from_text(value))
 
-                instructions = (IN_MEMORY_MARKER + self._markup_to_html(value),
-                                'instructions')
-                extend_supplement_links(
-                    supplement_content, {IN_MEMORY_EXTENSION: [instructions]})
+                self._extend_with_html(supplement_content, value,
+                                       'instructions')
 
             return supplement_content
         except requests.exceptions.HTTPError as exception:
@@ -1280,12 +1912,54 @@ class CourseraOnDemand(object):
                                   element_id, exception)
             return None
 
+    def _extend_with_html(self, links, markup, title):
+        """
+        Render markup to HTML and add it to links as a page, unless pages
+        are not going to be downloaded anyway. If rendering is deferred,
+        the markup itself is added instead. Both are moved to the page
+        store if there is one.
+
+        @param links: Links to add the page to.
+        @type links: @see CourseraOnDemand._extract_links_from_text
+
+        @param markup: Coursera markup (or HTML) to render.
+        @type markup: str
+
+        @param title: Title of the page.
+        @type title: str
+        """
+        if not self._format_selector.wants(IN_MEMORY_EXTENSION):
+            return
+
+        if self._defer_rendering:
+            page = IN_MARKUP_MARKER + markup
+        else:
+            page = IN_MEMORY_MARKER + self._markup_to_html(markup)
+        if self._page_store is not None:
+            page = self._page_store.spill(page)
+        extend_supplement_links(
+            links, {IN_MEMORY_EXTENSION: [(page, title)]})
+
+    def _select_asset_tags(self, asset_tags_map):
+        """
+        Select ids of asset tags whose files are going to be downloaded.
+
+        @param asset_tags_map: @see CourseraOnDemand._extract_asset_tags
+
+        @return: Asset ids.
+        @rtype: [str]
+        """
+        return [asset_id for asset_id, asset in asset_tags_map.items()
+                if self._format_selector.wants(clean_filename(
+                    asset['extension'].strip(),
+                    self._unrestricted_filenames))]
+
     def _extract_asset_tags(self, text):
         """
         Extract asset tags from text into a convenient form.
 
         @param text: Text to extract asset tags from. This text contains HTML
-            code that is parsed by BeautifulSoup.
+            code that is scanned by scan_markup.
         @type text: str
 
         @return: Asset map.
@@ -1297,15 +1971,33 @@ class CourseraOnDemand(object):
             ...
         }
         """
-        soup = BeautifulSoup(text)
         asset_tags_map = {}
 
-        for asset in soup.find_all('asset'):
+        for asset in scan_markup(text).asset_tags:
             asset_tags_map[asset['id']] = {'name': asset['name'],
                                            'extension': asset['extension']}
 
         return asset_tags_map
 
+    def _prefetch_asset_urls(self, open_course_assets):
+        """
+        Resolve URLs of assets referenced by <asset> tags in all given texts
+        at once, instead of making one request per text.
+
+        @param open_course_assets: openCourseAssets.v1 elements with texts
+            in definition -> value.
+        @type open_course_assets: [dict]
+        """
+        if len(open_course_assets) < 2:
+            return
+
+        asset_ids = []
+        for asset in open_course_assets:
+            asset_ids.extend(self._select_asset_tags(
+                self._extract_asset_tags(asset['definition']['value'])))
+        if asset_ids:
+            self._asset_resolver.get_asset_urls(asset_ids)
+
     def _extract_asset_urls(self, asset_ids):
         """
         Extract asset URLs along with asset ids.
@@ -1319,13 +2011,11 @@ class CourseraOnDemand(object):
             'url': '<url>'
         }]
         """
-        dom = get_page(self._session, OPENCOURSE_ASSET_URL,
-                       json=True,
-                       ids=quote_plus(','.join(asset_ids)))
+        asset_urls = self._asset_resolver.get_asset_urls(asset_ids)
 
         return [{'id': element['id'],
                  'url': element['url'].strip()}
-                for element in dom['elements']]
+                for element in asset_urls.values()]
 
     def extract_references_poll(self):
         try:
@@ -1368,6 +2058,7 @@ class CourseraOnDemand(object):
             #       'definition' {
             #           'value'
 
+            self._prefetch_asset_urls(dom['linked']['openCourseAssets.v1'])
             for asset in dom['linked']['openCourseAssets.v1']:
                 value = asset['definition']['value']
                 # Supplement lecture types are known to contain both <asset> tags
@@ -1376,10 +2067,7 @@ class CourseraOnDemand(object):
                 extend_supplement_links(
                     resource_content, self._extract_links_from_text(value))
 
-                instructions = (IN_MEMORY_MARKER + self._markup_to_html(value),
-                                'resources')
-                extend_supplement_links(
-                    resource_content, {IN_MEMORY_EXTENSION: [instructions]})
+                self._extend_with_html(resource_content, value, 'resources')
 
             return resource_content
         except requests.exceptions.HTTPError as exception:
@@ -1534,7 +2222,7 @@ class CourseraOnDemand(object):
         """
         # Extract asset tags from instructions text
         asset_tags_map = self._extract_asset_tags(text)
-        ids = list(asset_tags_map.keys())
+        ids = self._select_asset_tags(asset_tags_map)
         if not ids:
             return {}
 
@@ -1579,9 +2267,7 @@ class CourseraOnDemand(object):
             ]
         }
         """
-        soup = BeautifulSoup(text)
-        links = [item['href'].strip()
-                 for item in soup.find_all('a') if 'href' in item.attrs]
+        links = [link.strip() for link in scan_markup(text).links]
         links = sorted(list(set(links)))
         supplement_links = {}
 
@@ -0,0 +1,107 @@
+"""
+Measure rendering of large instruction and quiz documents by
+MarkupToHTMLConverter and QuizExamToMarkupConverter. No requests are made,
+assets are served by a stub retriever.
+
+Usage:
+
+    python benchmarks/markup.py [--sections N] [--questions N] [--rounds N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import (MarkupToHTMLConverter,  # noqa: E402
+                 QuizExamToMarkupConverter)
+
+
+class StubAsset(object):
+    data = b'\x89PNG\r\n'
+    content_type = 'image/png'
+
+
+class StubAssetRetriever(object):
+    """
+    Asset retriever that returns the same tiny image for every asset.
+    """
+
+    def __call__(self, asset_ids, download=True):
+        return [StubAsset() for _ in asset_ids]
+
+    def __getitem__(self, asset_id):
+        return StubAsset()
+
+
+def make_instructions(sections):
+    parts = ['<co-content>']
+    for index in range(sections):
+        parts.append(
+            '<heading level="2">Section %d</heading>'
+            '<text>Paragraph %d with <b>bold</b> text &amp; a '
+            '<a href="https://example.com/file%d.pdf">link</a>.</text>'
+            '<list bulletType="bullets"><li><text>First</text></li>'
+            '<li><text>Second</text></li></list>'
+            '<code>x = %d\nprint(x)</code>'
+            '<img assetId="image%d"/>' % (index, index, index, index, index))
+    parts.append('</co-content>')
+    return ''.join(parts)
+
+
+def make_quiz(questions):
+    def option(text):
+        return {'display': {'definition': {
+            'value': '<co-content><text>%s</text></co-content>' % text}}}
+
+    return {'questions': [
+        {'question': {'type': 'mcq'},
+         'variant': {'definition': {
+             'prompt': {'definition': {
+                 'value': '<co-content><text>Question %d?</text>'
+                          '</co-content>' % index}},
+             'options': [option('Option %d' % number)
+                         for number in range(4)]}}}
+        for index in range(questions)]}
+
+
+def measure(function, argument, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = function(argument)
+    return (time.perf_counter() - start) / rounds, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--sections', type=int, default=500,
+                        help='number of sections in instructions')
+    parser.add_argument('--questions', type=int, default=200,
+                        help='number of quiz questions')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='number of measurements to average')
+    args = parser.parse_args()
+
+    markup_to_html = MarkupToHTMLConverter(
+        None, asset_retriever=StubAssetRetriever())
+    quiz_to_markup = QuizExamToMarkupConverter(None)
+
+    instructions = make_instructions(args.sections)
+    elapsed, html = measure(markup_to_html, instructions, args.rounds)
+    print('instructions (%d bytes -> %d bytes): %.3f s' % (
+        len(instructions), len(html), elapsed))
+
+    quiz = make_quiz(args.questions)
+    elapsed, markup = measure(quiz_to_markup, quiz, args.rounds)
+    print('quiz to markup (%d questions): %.3f s' % (
+        args.questions, elapsed))
+    elapsed, html = measure(markup_to_html, markup, args.rounds)
+    print('quiz markup to html (%d bytes -> %d bytes): %.3f s' % (
+        len(markup), len(html), elapsed))
+
+
+if __name__ == '__main__':
+    main()
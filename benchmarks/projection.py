@@ -0,0 +1,107 @@
+"""
+Compare full and projected (lean) Coursera API URL templates: bytes
+transferred and time spent parsing JSON replies.
+
+Usage:
+
+    python benchmarks/projection.py -ca CAUTH course-slug [course-slug ...]
+
+Specializations can be passed with --specialization.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from coursera_dl import get_session  # noqa: E402
+from network import get_reply  # noqa: E402
+from define import (  # noqa: E402
+    OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2,
+    OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2_LEAN,
+    OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL,
+    OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL_LEAN,
+    OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1,
+    OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1_LEAN)
+
+#: Number of times every JSON reply is parsed
+PARSE_ROUNDS = 20
+
+
+def measure(session, url):
+    """
+    Download url and measure size of the reply and average parse time.
+
+    @return: Tuple of (size in bytes, parse time in ms, parsed reply).
+    @rtype: (int, float, dict)
+    """
+    text = get_reply(session, url).text
+
+    start = time.perf_counter()
+    for _ in range(PARSE_ROUNDS):
+        dom = json.loads(text)
+    elapsed = (time.perf_counter() - start) / PARSE_ROUNDS
+
+    return len(text.encode('utf-8')), elapsed * 1000, dom
+
+
+def compare(session, name, full_url, lean_url):
+    full_size, full_time, full_dom = measure(session, full_url)
+    lean_size, lean_time, _lean_dom = measure(session, lean_url)
+    print('%-40s %10d %10d %5.1f%% %8.2f %8.2f' % (
+        name, full_size, lean_size, 100.0 * lean_size / full_size,
+        full_time, lean_time))
+    return full_dom
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('-ca', '--cauth', dest='cauth', required=True,
+                        help='value of CAUTH cookie')
+    parser.add_argument('--specialization', dest='specializations',
+                        action='append', default=[],
+                        help='specialization slug, may be repeated')
+    parser.add_argument('class_names', nargs='*',
+                        help='course slugs')
+    args = parser.parse_args()
+
+    session = get_session()
+    session.cookies.set('CAUTH', args.cauth)
+
+    print('%-40s %10s %10s %6s %8s %8s' % (
+        'reply', 'full, B', 'lean, B', 'lean', 'full, ms', 'lean, ms'))
+
+    for class_name in args.class_names:
+        dom = compare(
+            session, 'syllabus %s' % class_name,
+            OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2.format(
+                class_name=class_name),
+            OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2_LEAN.format(
+                class_name=class_name))
+
+        course_id = dom['elements'][0]['id']
+        lectures = [item for item
+                    in dom['linked']['onDemandCourseMaterialItems.v2']
+                    if item['contentSummary']['typeName'] == 'lecture']
+        if lectures:
+            video_id = lectures[0]['id']
+            compare(session, 'video %s' % lectures[0]['slug'],
+                    OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL.format(
+                        course_id=course_id, video_id=video_id),
+                    OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL_LEAN.format(
+                        course_id=course_id, video_id=video_id))
+
+    for specialization in args.specializations:
+        compare(session, 'specialization %s' % specialization,
+                OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1.format(
+                    class_name=specialization),
+                OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1_LEAN.format(
+                    class_name=specialization))
+
+
+if __name__ == '__main__':
+    main()
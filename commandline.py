@@ -12,9 +12,13 @@ __courseradlversion__ = '0.12.0b0'
 # from maingui import __version__
 
 from credentials import get_credentials, CredentialsError
+from ratelimit import parse_rate
 
 LOCAL_CONF_FILE_NAME = 'coursera-dl.conf'
 
+#: Value of --jobs that lets the number of parallel downloads adapt
+JOBS_AUTO = 'auto'
+
 
 def class_name_arg_required(args):
     """
@@ -30,6 +34,35 @@ def class_name_arg_required(args):
     )
 
 
+def jobs_arg(value):
+    """
+    Parse the value of --jobs, which is a number of jobs or "auto".
+
+    @param value: Value passed on the command line.
+    @type value: str
+
+    @return: Number of jobs or JOBS_AUTO.
+    @rtype: int or str
+    """
+    if value == JOBS_AUTO:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected a number or "%s", got "%s"' % (JOBS_AUTO, value))
+
+
+def rate_arg(value):
+    """
+    Parse the value of --max-rate, @see ratelimit.parse_rate.
+    """
+    try:
+        return parse_rate(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def parse_args(args=None):
     """
     Parse the arguments/options passed to the program on the command line.
@@ -74,9 +107,80 @@ def parse_args(args=None):
         dest='jobs',
         action='store',
         default=1,
+        type=jobs_arg,
+        help='number of parallel jobs to use for '
+        'downloading resources, "auto" adjusts it to the measured '
+        'throughput and errors. (Default: 1)')
+
+    group_basic.add_argument(
+        '--download-processes',
+        dest='download_processes',
+        action='store',
+        default=0,
+        type=int,
+        help='number of worker processes to download resources in, '
+        'use it instead of --jobs when downloads are limited by the CPU '
+        'on fast links, 0 disables it. (Default: 0)')
+
+    group_basic.add_argument(
+        '--async-jobs',
+        dest='async_jobs',
+        action='store',
+        default=0,
+        type=int,
+        help='number of concurrent downloads to run on a single thread '
+        'with asyncio (requires aiohttp and the native downloader), '
+        '0 disables it. Only cookies and headers of the session are used: '
+        'its TLS adapter, certificate verification and proxy settings '
+        'and --segments are not. (Default: 0)')
+
+    group_basic.add_argument(
+        '--extract-jobs',
+        dest='extract_jobs',
+        action='store',
+        default=1,
         type=int,
         help='number of parallel jobs to use for '
-        'downloading resources. (Default: 1)')
+        'extracting links from the course syllabus. (Default: 1)')
+
+    group_basic.add_argument(
+        '--render-jobs',
+        dest='render_jobs',
+        action='store',
+        default=0,
+        type=int,
+        help='number of worker processes to use for rendering quizzes '
+        'and instructions into HTML, 0 renders them in the calling '
+        'thread. (Default: 0)')
+
+    group_basic.add_argument(
+        '--max-rate',
+        dest='max_rate',
+        action='store',
+        default=0,
+        type=rate_arg,
+        help='limit the total download rate of the built-in downloader '
+        'in bytes per second, K, M and G suffixes are allowed (e.g. 20M), '
+        '0 means unlimited. (Default: 0)')
+
+    group_basic.add_argument(
+        '--max-rate-file',
+        dest='max_rate_file',
+        action='store',
+        default=None,
+        help='file that holds a new value of --max-rate, it is re-read '
+        'while downloading, so the limit may be changed without '
+        'restarting')
+
+    group_basic.add_argument(
+        '--segments',
+        dest='segments',
+        action='store',
+        default=1,
+        type=int,
+        help='number of connections the built-in downloader uses for '
+        'each large file, segments are fetched from the start of the file '
+        'and can be resumed with --resume. (Default: 1)')
 
     group_basic.add_argument(
         '--download-delay',
@@ -144,6 +248,24 @@ def parse_args(args=None):
         help='download only syllabus, skip course content. '
         '(Default: False)')
 
+    group_material.add_argument(
+        '--syllabus-structure',
+        dest='syllabus_structure',
+        action='store_true',
+        default=False,
+        help='list modules, sections and items of the course without '
+        'extracting any links, and skip course content. Section and item '
+        'names are the ones matched by section and lecture filters. '
+        '(Default: False)')
+
+    group_material.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        default=False,
+        help='remember extracted links of the course and on the next run '
+        'extract links only from new or changed items (Default: False)')
+
     group_material.add_argument(
         '--download-quizzes',
         dest='download_quizzes',
@@ -397,6 +519,22 @@ def parse_args(args=None):
         default=False,
         help='generate M3U playlists for course weeks')
 
+    group_adv_misc.add_argument(
+        '--http-cache',
+        dest='http_cache',
+        action='store_true',
+        default=False,
+        help='keep replies of Coursera API in a persistent cache so that '
+        'they are not downloaded again on the next run (default: False)')
+
+    group_adv_misc.add_argument(
+        '--http-cache-size',
+        dest='http_cache_size',
+        action='store',
+        default=200,
+        type=int,
+        help='maximum size of the HTTP cache in megabytes (default: 200)')
+
     group_adv_misc.add_argument(
         '--mathjax-cdn',
         dest='mathjax_cdn_url',
@@ -404,6 +542,15 @@ def parse_args(args=None):
         help='the cdn address of MathJax.js'
     )
 
+    group_adv_misc.add_argument(
+        '--save-assets',
+        dest='save_assets',
+        action='store_true',
+        default=False,
+        help='save images and audios of instructions and quizzes to the '
+        'assets directory of the course instead of embedding them into '
+        'every page')
+
     # Debug options
     group_debug = parser.add_argument_group('Debugging options')
 
@@ -426,7 +573,17 @@ def parse_args(args=None):
         dest='cache_syllabus',
         action='store_true',
         default=False,
-        help='cache course syllabus into a file')
+        help='cache parsed course syllabus, so that resumed runs can '
+        'start downloading without extracting it again')
+
+    group_debug.add_argument(
+        '--cache-syllabus-max-age',
+        dest='cache_syllabus_max_age',
+        action='store',
+        default=24,
+        type=int,
+        help='ignore cached syllabus older than this number of hours. '
+        '(Default: 24)')
 
     group_debug.add_argument(
         '--version',
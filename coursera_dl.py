@@ -61,18 +61,26 @@ from cookies import (
     AuthenticationFailed, ClassNotFound,
     get_cookies_for_class, make_cookie_values, TLSAdapter, login)
 from define import (CLASS_URL, ABOUT_URL, PATH_CACHE)
-from downloaders import get_downloader
+from downloaders import get_downloader, NativeDownloader
 from workflow import CourseraDownloader
-from parallel import ConsecutiveDownloader, ParallelDownloader
+from parallel import (AdaptiveDownloader, AsyncDownloader,
+                      ConsecutiveDownloader, ParallelDownloader,
+                      ProcessDownloader, iter_in_background, process_pool)
 from utils import (clean_filename, get_anchor_format, mkdir_p, fix_url,
                    print_ssl_error_message,
                    BeautifulSoup, is_debug_run,
-                   spit_json, slurp_json)
+                   spit_json, normalize_path)
 
-from api import expand_specializations
-from network import get_page, get_page_and_url
-from commandline import parse_args
-from extractors import CourseraExtractor
+from api import expand_specializations, MarkupToHTMLConverter
+from network import get_page, get_page_and_url, set_response_cache
+from httpcache import ResponseCache
+from commandline import parse_args, JOBS_AUTO
+from extractors import CourseraExtractor, group_lectures, collect_modules
+from syllabuscache import SyllabusCache
+from specializationcache import SpecializationCache
+from pagestore import PageStore, PAGE_MAX_AGE, load_pages
+from filtering import FormatSelector
+from ratelimit import RateLimiter
 
 
 # URL containing information about outdated modules
@@ -151,11 +159,80 @@ def list_courses(args):
         logging.info(course)
 
 
-def download_on_demand_class(session, args, class_name):
+def print_syllabus_structure(class_name, syllabus):
+    """
+    Print modules, sections and items of a course.
+
+    @param syllabus: @see extractors.build_syllabus
+    @type syllabus: list
+    """
+    item_count = 0
+    logging.info('Syllabus of %s:', class_name)
+    for module_index, (module, sections) in enumerate(syllabus):
+        logging.info('%02d %s', module_index + 1, module.slug)
+        for section_index, (section, items) in enumerate(sections):
+            logging.info('   %02d %s', section_index + 1, section.slug)
+            for item_index, item in enumerate(items):
+                logging.info('      %02d %s (%s)',
+                             item_index + 1, item.slug, item.type_name)
+            item_count += len(items)
+    logging.info('%d modules, %d sections, %d items', len(syllabus),
+                 sum(len(sections) for _module, sections in syllabus),
+                 item_count)
+
+
+def _remember_lectures(lectures, extracted_lectures):
+    """
+    Pass lectures through, appending each of them to extracted_lectures.
+    """
+    for lecture in lectures:
+        extracted_lectures.append(lecture)
+        yield lecture
+
+
+def get_downloader_wrapper(downloader, args):
+    """
+    Choose how downloads of the class are scheduled.
+
+    @param downloader: File downloader.
+    @type downloader: downloaders.Downloader
+
+    @return: Download wrapper.
+    @rtype: parallel.AbstractDownloader
+    """
+    if args.async_jobs > 0:
+        if not isinstance(downloader, NativeDownloader):
+            logging.warning('--async-jobs works only with the native '
+                            'downloader, ignoring it')
+        else:
+            try:
+                return AsyncDownloader(downloader, args.async_jobs)
+            except ImportError:
+                logging.warning('--async-jobs requires aiohttp, '
+                                'ignoring it')
+
+    if args.download_processes > 0:
+        return ProcessDownloader(downloader, args.download_processes)
+    if args.jobs == JOBS_AUTO:
+        return AdaptiveDownloader(downloader)
+    if args.jobs > 1:
+        return ParallelDownloader(downloader, args.jobs)
+    return ConsecutiveDownloader(downloader)
+
+
+def download_on_demand_class(session, args, class_name, render_pool=None,
+                             rate_limiter=None):
     """
     Download all requested resources from the on-demand class given
     in class_name.
 
+    @param render_pool: Process pool to render pages in, @see
+        parallel.process_pool
+    @type render_pool: multiprocessing.Pool
+
+    @param rate_limiter: Limiter of the download rate.
+    @type rate_limiter: ratelimit.RateLimiter
+
     @return: Tuple of (bool, bool), where the first bool indicates whether
         errors occurred while parsing syllabus, the second bool indicates
         whether the course appears to be completed.
@@ -163,11 +240,84 @@ def download_on_demand_class(session, args, class_name):
     """
 
     error_occurred = False
-    extractor = CourseraExtractor(session)
+    page_store = PageStore.of_course(class_name)
+    page_store.prune(PAGE_MAX_AGE)
+    extractor = CourseraExtractor(session,
+                                  extract_jobs=args.extract_jobs,
+                                  incremental=args.incremental,
+                                  render_pool=render_pool,
+                                  # Pages are rendered when they are saved,
+                                  # unless only the syllabus is wanted
+                                  defer_rendering=not args.only_syllabus,
+                                  page_store=page_store,
+                                  overwrite=args.overwrite)
+
+    if args.syllabus_structure:
+        print_syllabus_structure(
+            class_name,
+            extractor.get_syllabus_structure(class_name, args.reverse))
+        return error_occurred, False
 
-    cached_syllabus_filename = '%s-syllabus-parsed.json' % class_name
-    if args.cache_syllabus and os.path.isfile(cached_syllabus_filename):
-        modules = slurp_json(cached_syllabus_filename)
+    ignored_formats = []
+    if args.ignore_formats:
+        ignored_formats = args.ignore_formats.split(",")
+    format_selector = FormatSelector(args.file_formats, ignored_formats)
+
+    syllabus_cache = SyllabusCache(
+        max_age=args.cache_syllabus_max_age * 3600) \
+        if args.cache_syllabus else None
+    # Options that affect extracted links, cached syllabuses are kept
+    # separately for each combination of them
+    syllabus_options = {
+        'reverse': args.reverse,
+        'unrestricted_filenames': args.unrestricted_filenames,
+        'subtitle_language': args.subtitle_language,
+        'video_resolution': args.video_resolution,
+        'download_quizzes': args.download_quizzes,
+        'mathjax_cdn_url': args.mathjax_cdn_url,
+        'download_notebooks': args.download_notebooks,
+        'section_filter': args.section_filter,
+        'lecture_filter': args.lecture_filter,
+        'file_formats': args.file_formats,
+        'ignored_formats': ignored_formats,
+        # Pages are rendered while extracting with --only-syllabus
+        'defer_rendering': not args.only_syllabus,
+    }
+
+    # Unless the whole syllabus is needed up front, lectures are handed
+    # to the downloader as soon as their links have been extracted
+    stream_syllabus = not (args.only_syllabus or is_debug_run())
+    extracted_lectures = None
+
+    modules = None
+    if syllabus_cache is not None:
+        modules = syllabus_cache.load(class_name, syllabus_options)
+
+    if modules is not None:
+        if not stream_syllabus:
+            spit_json(load_pages(modules),
+                      '%s-syllabus-parsed.json' % class_name)
+        stream_syllabus = False
+    elif stream_syllabus:
+        lectures = iter_in_background(extractor.iter_lectures(
+            class_name,
+            args.reverse,
+            args.unrestricted_filenames,
+            args.subtitle_language,
+            args.video_resolution,
+            args.download_quizzes,
+            args.mathjax_cdn_url,
+            args.download_notebooks,
+            args.section_filter,
+            args.lecture_filter,
+            format_selector
+        ))
+        if syllabus_cache is not None:
+            # Remember lectures as they pass to the downloader, so that
+            # the syllabus can be cached once it has been downloaded
+            extracted_lectures = []
+            lectures = _remember_lectures(lectures, extracted_lectures)
+        modules = group_lectures(lectures)
     else:
         error_occurred, modules = extractor.get_modules(
             class_name,
@@ -177,24 +327,30 @@ def download_on_demand_class(session, args, class_name):
             args.video_resolution,
             args.download_quizzes,
             args.mathjax_cdn_url,
-            args.download_notebooks
+            args.download_notebooks,
+            args.section_filter,
+            args.lecture_filter,
+            format_selector
         )
 
-    if is_debug_run or args.cache_syllabus():
-        spit_json(modules, cached_syllabus_filename)
+        # The parsed syllabus should be usable without the page store
+        spit_json(load_pages(modules), '%s-syllabus-parsed.json' % class_name)
+        if syllabus_cache is not None and not error_occurred:
+            syllabus_cache.save(class_name, syllabus_options, modules)
 
     if args.only_syllabus:
         return error_occurred, False
 
-    downloader = get_downloader(session, class_name, args)
-    downloader_wrapper = ParallelDownloader(downloader, args.jobs) \
-        if args.jobs > 1 else ConsecutiveDownloader(downloader)
+    downloader = get_downloader(session, class_name, args, rate_limiter)
+    downloader_wrapper = get_downloader_wrapper(downloader, args)
 
-    # obtain the resources
+    # Images and audios of pages may be shared by the whole course
+    assets_dir = None
+    if args.save_assets:
+        assets_dir = normalize_path(
+            os.path.join(args.path, class_name, 'assets'))
 
-    ignored_formats = []
-    if args.ignore_formats:
-        ignored_formats = args.ignore_formats.split(",")
+    # obtain the resources
 
     course_downloader = CourseraDownloader(
         downloader_wrapper,
@@ -202,10 +358,19 @@ def download_on_demand_class(session, args, class_name):
         class_name=class_name,
         path=args.path,
         ignored_formats=ignored_formats,
-        disable_url_skipping=args.disable_url_skipping
+        disable_url_skipping=args.disable_url_skipping,
+        renderer=MarkupToHTMLConverter(
+            session, mathjax_cdn_url=args.mathjax_cdn_url,
+            render_pool=render_pool,
+            assets_dir=assets_dir)
     )
 
     completed = course_downloader.download_modules(modules)
+    if stream_syllabus:
+        error_occurred = extractor.error_occurred
+        if extracted_lectures is not None and not error_occurred:
+            syllabus_cache.save(class_name, syllabus_options,
+                                collect_modules(extracted_lectures))
 
     # Print skipped URLs if any
     if course_downloader.skipped_urls:
@@ -239,7 +404,7 @@ def print_failed_urls(failed_urls):
     logging.info('-' * 80)
 
 
-def download_class(session, args, class_name):
+def download_class(session, args, class_name, rate_limiter=None):
     """
     Try to download on-demand class.
 
@@ -249,7 +414,9 @@ def download_class(session, args, class_name):
     @rtype: (bool, bool)
     """
     logging.debug('Downloading new style (on demand) class %s', class_name)
-    return download_on_demand_class(session, args, class_name)
+    with process_pool(args.render_jobs) as render_pool:
+        return download_on_demand_class(session, args, class_name,
+                                        render_pool, rate_limiter)
 
 
 def main_f(cmd):
@@ -267,6 +434,9 @@ def main_f(cmd):
     mkdir_p(PATH_CACHE, 0o700)
     if args.clear_cache:
         shutil.rmtree(PATH_CACHE)
+    set_response_cache(
+        ResponseCache(max_size=args.http_cache_size * 1024 * 1024)
+        if args.http_cache else None)
     if args.list_courses:
         logging.info('Listing enrolled courses')
         list_courses(args)
@@ -275,14 +445,20 @@ def main_f(cmd):
     session = create_session(args)
 
     if args.specialization:
-        args.class_names = expand_specializations(session, args.class_names)
+        args.class_names = expand_specializations(
+            session, args.class_names, SpecializationCache())
+
+    # One limiter for all classes, so that the rate holds for the whole run
+    rate_limiter = None
+    if args.max_rate or args.max_rate_file:
+        rate_limiter = RateLimiter(args.max_rate, args.max_rate_file)
 
     for class_index, class_name in enumerate(args.class_names):
         try:
             logging.info('Downloading class: %s (%d / %d)',
                          class_name, class_index + 1, len(args.class_names))
             error_occurred, completed = download_class(
-                session, args, class_name)
+                session, args, class_name, rate_limiter)
             if completed:
                 completed_classes.append(class_name)
             if error_occurred:
@@ -309,7 +485,9 @@ def main_f(cmd):
             logging.error('Could not authenticate: %s', e)
             raise
 
-        if class_index + 1 != len(args.class_names):
+        # Listing syllabus structure is a single request per course
+        if class_index + 1 != len(args.class_names) and \
+                not args.syllabus_structure:
             logging.info('Sleeping for %d seconds before downloading next course. '
                          'You can change this with --download-delay option.',
                          args.download_delay)
@@ -65,6 +65,12 @@ OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL = \
     'https://api.coursera.org/api/onDemandLectureVideos.v1/'\
     '{course_id}~{video_id}?includes=video&'\
     'fields=onDemandVideos.v1(sources%2Csubtitles%2CsubtitlesVtt%2CsubtitlesTxt)'
+# Projection of OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL without WebVTT
+# subtitles, which are not downloaded
+OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL_LEAN = \
+    'https://api.coursera.org/api/onDemandLectureVideos.v1/'\
+    '{course_id}~{video_id}?includes=video&'\
+    'fields=onDemandVideos.v1(sources%2Csubtitles%2CsubtitlesTxt)'
 OPENCOURSE_SUPPLEMENT_URL = 'https://api.coursera.org/api/onDemandSupplements.v1/'\
     '{course_id}~{element_id}?includes=asset&fields=openCourseAssets.v1%28typeName%29,openCourseAssets.v1%28definition%29'
 OPENCOURSE_PROGRAMMING_ASSIGNMENTS_URL = \
@@ -199,6 +205,15 @@ OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2 = \
     '&fields=moduleIds%2ConDemandCourseMaterialModules.v1(name%2Cslug%2Cdescription%2CtimeCommitment%2ClessonIds%2Coptional%2ClearningObjectives)%2ConDemandCourseMaterialLessons.v1(name%2Cslug%2CtimeCommitment%2CelementIds%2Coptional%2CtrackId)%2ConDemandCourseMaterialPassableItemGroups.v1(requiredPassedCount%2CpassableItemGroupChoiceIds%2CtrackId)%2ConDemandCourseMaterialPassableItemGroupChoices.v1(name%2Cdescription%2CitemIds)%2ConDemandCourseMaterialPassableLessonElements.v1(gradingWeight%2CisRequiredForPassing)%2ConDemandCourseMaterialItems.v2(name%2Cslug%2CtimeCommitment%2CcontentSummary%2CisLocked%2ClockableByItem%2CitemLockedReasonCode%2CtrackId%2ClockedStatus%2CitemLockSummary)%2ConDemandCourseMaterialTracks.v1(passablesCount)'\
     '&showLockedItems=true'
 
+# Projection of OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2 that includes only
+# modules, lessons and items with the fields read by ModulesV1, LessonsV1
+# and ItemsV2 (see network.get_projected_page)
+OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2_LEAN = \
+    'https://api.coursera.org/api/onDemandCourseMaterials.v2/?q=slug&slug={class_name}'\
+    '&includes=modules%2Clessons%2Citems'\
+    '&fields=onDemandCourseMaterialModules.v1(name%2Cslug%2ClessonIds)%2ConDemandCourseMaterialLessons.v1(name%2Cslug%2CitemIds)%2ConDemandCourseMaterialItems.v2(name%2Cslug%2CcontentSummary%2ClessonId%2CmoduleId)'\
+    '&showLockedItems=true'
+
 OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1 = \
     'https://api.coursera.org/api/onDemandSpecializations.v1?q=slug'\
     '&slug={class_name}&fields=courseIds,interchangeableCourseIds,launchedAt,'\
@@ -214,6 +229,12 @@ OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1 = \
     'courses.v1(courseProgress,membershipIds,v2Details,vcMembershipIds),'\
     'v2Details.v1(onDemandSessions)'
 
+# Projection of OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1, only slugs of the
+# courses are read by SpecializationV1
+OPENCOURSE_ONDEMAND_SPECIALIZATIONS_V1_LEAN = \
+    'https://api.coursera.org/api/onDemandSpecializations.v1?q=slug'\
+    '&slug={class_name}&fields=courseIds&includes=courseIds'
+
 OPENCOURSE_ONDEMAND_COURSES_V1 = \
     'https://api.coursera.org/api/onDemandCourses.v1?q=slug&slug={class_name}&'\
     'includes=instructorIds%2CpartnerIds%2C_links&'\
@@ -908,6 +929,31 @@ else:
 
 PATH_CACHE = os.path.join(tempfile.gettempdir(), _USER + "_coursera_dl_cache")
 PATH_COOKIES = os.path.join(PATH_CACHE, 'cookies')
+PATH_HTTP_CACHE = os.path.join(PATH_CACHE, 'http')
+PATH_SNAPSHOTS = os.path.join(PATH_CACHE, 'snapshots')
+PATH_SYLLABUS_CACHE = os.path.join(PATH_CACHE, 'syllabus')
+PATH_PAGES = os.path.join(PATH_CACHE, 'pages')
+PATH_SPECIALIZATION_CACHE = os.path.join(PATH_CACHE, 'specializations.json.gz')
+
+#: Time to live (in seconds) of cached replies of API endpoints, see
+#: httpcache.ResponseCache. Replies of endpoints that are not listed here
+#: are never cached. Replies with signed URLs are also limited by the
+#: expiration time of those URLs.
+HTTP_CACHE_TTLS = [
+    (r'/api/onDemandCourseMaterials\.v2/', 24 * 3600),
+    (r'/api/memberships\.v1', 3600),
+    (r'/api/onDemandSpecializations\.v1', 24 * 3600),
+    (r'/api/onDemandLectureVideos\.v1/', 24 * 3600),
+    (r'/api/onDemandLectureAssets\.v1/', 24 * 3600),
+    (r'/api/openCourseAssets\.v1/', 24 * 3600),
+    (r'/api/assets\.v1', 24 * 3600),
+    (r'/api/assetUrls\.v1', 24 * 3600),
+    (r'/api/onDemandSupplements\.v1/', 24 * 3600),
+    (r'/api/onDemandProgrammingLearnerAssignments\.v1/', 24 * 3600),
+    (r'/api/onDemandProgrammingImmediateInstructions\.v1/', 24 * 3600),
+    (r'/api/onDemandPeerAssignmentInstructions\.v1', 24 * 3600),
+    (r'/api/onDemandReferences\.v1/', 24 * 3600),
+]
 
 WINDOWS_UNC_PREFIX = u'\\\\?\\'
 
@@ -920,6 +966,16 @@ IN_MEMORY_EXTENSION = 'html'
 #: field first.
 IN_MEMORY_MARKER = '#inmemory#'
 
+#: This marker is added in front of a path to a file in a page store
+#: (see pagestore.PageStore). Such URL is a handle of a page that is read
+#: from the store only when it is saved.
+IN_STORE_MARKER = '#instore#'
+
+#: This marker is added in front of Coursera markup of a page that has not
+#: been rendered yet. Such page is rendered into HTML (see
+#: api.MarkupToHTMLConverter) only when it is saved.
+IN_MARKUP_MARKER = '#inmarkup#'
+
 #: These are hard limits for format (file extension) and
 #: title (file name) lengths to avoid too long file names
 #: (longer than 255 characters)
@@ -9,15 +9,42 @@ namely, aria2c, axel, curl, and wget.
 
 from __future__ import print_function
 
+import json
 import logging
 import math
 import os
+import re
 import subprocess
 import sys
+import threading
 import time
 
+from collections import namedtuple
+from multiprocessing.dummy import Pool
+
 import requests
 
+#: HTTP codes of replies that ask clients to slow down
+THROTTLING_CODES = (429, 503)
+
+#: HTTP codes of replies that finish a download
+SUCCESS_CODES = (200, 206, 416)
+
+
+class DownloadOutcome(namedtuple('DownloadOutcome',
+                                 'status_code throttled retry_wait')):
+    """
+    Outcome of a download reported by NativeDownloader: HTTP code of the
+    last reply (None if unknown), number of replies that asked to slow
+    down and number of seconds spent waiting before retries.
+    """
+    __slots__ = ()
+
+    @property
+    def succeeded(self):
+        return self.status_code in SUCCESS_CODES
+
+
 #
 # Below are file downloaders, they are wrappers for external downloaders.
 #
@@ -46,10 +73,14 @@ class Downloader(object):
         """
         Download the given url to the given file. When the download
         is aborted by the user, the partially downloaded file is also removed.
+
+        @return: Outcome of the download if the downloader reports it,
+            None otherwise.
+        @rtype: DownloadOutcome
         """
 
         try:
-            self._start_download(url, filename, resume)
+            return self._start_download(url, filename, resume)
         except KeyboardInterrupt as e:
             # keep the file if resume is True
             if not resume:
@@ -315,15 +346,41 @@ class NativeDownloader(Downloader):
     """
     'Native' python downloader -- slower than the external downloaders.
 
+    Large files may be downloaded in segments over several connections,
+    see SegmentedDownload.
+
     :param session: Requests session.
+    :param segments: Number of connections used for each large file.
+    :param rate_limiter: Limiter of the download rate, shared with other
+        downloads (ratelimit.RateLimiter).
     """
 
-    def __init__(self, session):
+    def __init__(self, session, segments=1, rate_limiter=None):
         self.session = session
+        self.segments = segments
+        self.rate_limiter = rate_limiter
 
     def _start_download(self, url, filename, resume=False):
+        # Reply to the size probe of a segmented download that may be
+        # reused for the single-stream download
+        reply = None
+        if self.segments > 1:
+            download = SegmentedDownload(
+                self.session, url, filename, self.segments,
+                self.rate_limiter)
+            result = download.run(resume)
+            if result is not None:
+                return DownloadOutcome(206 if result else None,
+                                       download.throttled,
+                                       download.retry_wait)
+            reply = download.reply
+
         # resume has no meaning if the file doesn't exists!
         resume = resume and os.path.exists(filename)
+        if reply is not None and resume:
+            # The probe asked for the whole file, not for the rest
+            reply.close()
+            reply = None
 
         headers = {}
         filesize = None
@@ -337,8 +394,14 @@ class NativeDownloader(Downloader):
         max_attempts = 3
         attempts_count = 0
         error_msg = ''
+        throttled = 0
+        retry_wait = 0
         while attempts_count < max_attempts:
-            r = self.session.get(url, stream=True, headers=headers)
+            whole = reply is not None
+            if whole:
+                r, reply = reply, None
+            else:
+                r = self.session.get(url, stream=True, headers=headers)
 
             if r.status_code != 200:
                 # because in resume state we are downloading only a
@@ -347,12 +410,12 @@ class NativeDownloader(Downloader):
                 # 206: Partial Content
                 # 416: Requested Range Not Satisfiable
                 # which are OK for us.
-                if resume and r.status_code == 206:
+                if (resume or whole) and r.status_code == 206:
                     pass
                 elif resume and r.status_code == 416:
                     logging.info('%s already downloaded', filename)
                     r.close()
-                    return True
+                    return DownloadOutcome(416, throttled, retry_wait)
                 else:
                     print('%s %s %s' % (r.status_code, url, filesize))
                     logging.warn('Probably the file is missing from the AWS '
@@ -363,10 +426,13 @@ class NativeDownloader(Downloader):
                     else:
                         error_msg = 'HTTP Error ' + str(r.status_code)
 
+                    if r.status_code in THROTTLING_CODES:
+                        throttled += 1
                     wait_interval = 2 ** (attempts_count + 1)
                     msg = 'Error downloading, will retry in {0} seconds ...'
                     print(msg.format(wait_interval))
                     time.sleep(wait_interval)
+                    retry_wait += wait_interval
                     attempts_count += 1
                     continue
 
@@ -388,19 +454,278 @@ class NativeDownloader(Downloader):
                     break
                 progress.report(r.raw.tell())
                 f.write(data)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.consume(len(data))
             f.close()
             r.close()
-            return True
+            return DownloadOutcome(r.status_code, throttled, retry_wait)
 
         if attempts_count == max_attempts:
             logging.warn('Skipping, can\'t download file ...')
             logging.error(error_msg)
+            return DownloadOutcome(r.status_code, throttled, retry_wait)
+
+
+class SegmentedDownload(object):
+    """
+    Download of a file in segments (byte ranges) that are fetched in
+    parallel and written into a preallocated file at their offsets.
+
+    Segments are fetched in the order of their offsets, so the file fills
+    up from its start and a partially downloaded video can be played.
+    Finished segments are recorded in a state file next to the file, so
+    that an interrupted download can be resumed segment by segment.
+    """
+
+    #: Size of a segment in bytes
+    SEGMENT_SIZE = 8 * 1024 * 1024
+
+    #: Files smaller than this are downloaded over a single connection
+    MIN_SIZE = 2 * SEGMENT_SIZE
+
+    #: Suffix of the state file
+    STATE_SUFFIX = '.segments'
+
+    #: Number of attempts to fetch a segment
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, session, url, filename, connections,
+                 rate_limiter=None):
+        self._session = session
+        self._url = url
+        self._filename = filename
+        self._connections = connections
+        self._rate_limiter = rate_limiter
+        self._state_filename = filename + self.STATE_SUFFIX
+
+        self._lock = threading.Lock()
+        self._size = None
+        self._done = set()
+        self._progress = None
+        self._downloaded = 0
+
+        #: Open reply to the size probe (a request of the whole file) if
+        #: the file is not downloaded in segments, None otherwise
+        self.reply = None
+
+        #: Number of replies that asked to slow down
+        self.throttled = 0
+
+        #: Number of seconds spent waiting before retries
+        self.retry_wait = 0
+
+    def run(self, resume=False):
+        """
+        Download the file.
+
+        @param resume: Whether segments downloaded by an earlier run
+            should be kept.
+        @type resume: bool
+
+        If the file could not be downloaded, it is removed together with
+        the state file unless resume is set, so that it is not mistaken
+        for a downloaded file later.
+
+        @return: True if the file has been downloaded, False if it could
+            not be downloaded and None if the server does not support
+            ranges or the file is too small to be downloaded in segments
+            (the reply to the size probe is then kept in reply).
+        @rtype: bool
+        """
+        self._size = self._get_size()
+        if self._size is None or self._size < self.MIN_SIZE:
+            return None
+        self.reply.close()
+        self.reply = None
+
+        count = (self._size + self.SEGMENT_SIZE - 1) // self.SEGMENT_SIZE
+        if resume:
+            self._load_state(count)
+            if len(self._done) == count:
+                logging.info('%s already downloaded', self._filename)
+                self._remove_state()
+                return True
+        else:
+            self._done = set()
+
+        completed = False
+        try:
+            completed = self._fetch_segments(count, resume)
+        finally:
+            if not completed and not resume:
+                self._remove_file()
+        return completed
+
+    def _fetch_segments(self, count, resume):
+        # Preallocate the file, segments are written at their offsets
+        mode = 'r+b' if resume and os.path.exists(self._filename) else 'wb'
+        with open(self._filename, mode) as file_object:
+            file_object.truncate(self._size)
+        self._save_state()
+
+        pending = [index for index in range(count) if index not in self._done]
+        logging.info('Downloading %s -> %s in %d segments over %d '
+                     'connections', self._url, self._filename, len(pending),
+                     self._connections)
+
+        self._downloaded = len(self._done) * self.SEGMENT_SIZE
+        self._progress = DownloadProgress(self._size)
+        self._progress.start()
+
+        pool = Pool(processes=min(self._connections, len(pending)))
+        try:
+            # Tasks are taken in order, so lower segments are fetched first
+            results = pool.map(self._fetch_segment, pending, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        self._progress.stop()
+
+        if not all(results):
+            logging.warn('Skipping, can\'t download file ...')
+            logging.error('Could not download %d segments of %s',
+                          results.count(False), self._filename)
             return False
 
+        self._remove_state()
+        return True
+
+    def _get_size(self):
+        """
+        Find out the size of the file from a request of the whole file
+        as a range, its body is only read if the reply is reused (see
+        reply).
 
-def get_downloader(session, class_name, args):
+        @return: Size or None if the server does not support ranges.
+        @rtype: int
+        """
+        try:
+            self.reply = self._session.get(self._url, stream=True,
+                                           headers={'Range': 'bytes=0-'})
+        except requests.exceptions.RequestException as e:
+            logging.debug('Could not probe %s: %s', self._url, e)
+            return None
+
+        match = re.match(r'bytes 0-\d+/(\d+)$',
+                         self.reply.headers.get('Content-Range', ''))
+        if self.reply.status_code != 206 or match is None:
+            return None
+        return int(match.group(1))
+
+    def _load_state(self, count):
+        """
+        Load finished segments of an earlier run. A file without state
+        (e.g. downloaded over a single connection) keeps the segments that
+        it fully contains.
+        """
+        self._done = set()
+        if not os.path.exists(self._filename):
+            return
+
+        try:
+            with open(self._state_filename) as file_object:
+                state = json.load(file_object)
+            if state['size'] == self._size and \
+                    state['segment_size'] == self.SEGMENT_SIZE:
+                self._done = set(index for index in state['done']
+                                 if index < count)
+            return
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+        filesize = os.path.getsize(self._filename)
+        if filesize <= self._size:
+            self._done = set(range(filesize // self.SEGMENT_SIZE))
+            if filesize == self._size:
+                self._done = set(range(count))
+
+    def _save_state(self):
+        temp_filename = '%s.%s.tmp' % (
+            self._state_filename, threading.current_thread().ident)
+        with open(temp_filename, 'w') as file_object:
+            json.dump({'size': self._size,
+                       'segment_size': self.SEGMENT_SIZE,
+                       'done': sorted(self._done)}, file_object)
+        os.replace(temp_filename, self._state_filename)
+
+    def _remove_file(self):
+        for filename in (self._filename, self._state_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _remove_state(self):
+        try:
+            os.remove(self._state_filename)
+        except OSError:
+            pass
+
+    def _fetch_segment(self, index):
+        """
+        Fetch a segment and write it at its offset, retrying on errors.
+
+        @return: True if the segment has been written.
+        @rtype: bool
+        """
+        start = index * self.SEGMENT_SIZE
+        end = min(start + self.SEGMENT_SIZE, self._size) - 1
+        headers = {'Range': 'bytes={}-{}'.format(start, end)}
+
+        for attempt in range(self.MAX_ATTEMPTS):
+            written = 0
+            try:
+                r = self._session.get(self._url, stream=True,
+                                      headers=headers)
+                if r.status_code in THROTTLING_CODES:
+                    with self._lock:
+                        self.throttled += 1
+                if r.status_code == 206:
+                    with open(self._filename, 'r+b') as file_object:
+                        file_object.seek(start)
+                        while True:
+                            data = r.raw.read(1048576, decode_content=True)
+                            if not data:
+                                break
+                            file_object.write(data)
+                            written += len(data)
+                            self._report(len(data))
+                            if self._rate_limiter is not None:
+                                self._rate_limiter.consume(len(data))
+                r.close()
+            except (requests.exceptions.RequestException, IOError) as e:
+                logging.debug('Could not fetch segment %d of %s: %s',
+                              index, self._url, e)
+
+            if written == end - start + 1:
+                with self._lock:
+                    self._done.add(index)
+                    self._save_state()
+                return True
+
+            self._report(-written)
+            if attempt + 1 < self.MAX_ATTEMPTS:
+                wait_interval = 2 ** (attempt + 1)
+                logging.debug('Segment %d of %s failed, will retry in %d '
+                              'seconds', index, self._filename,
+                              wait_interval)
+                time.sleep(wait_interval)
+                with self._lock:
+                    self.retry_wait += wait_interval
+
+        return False
+
+    def _report(self, size):
+        with self._lock:
+            self._downloaded += size
+            self._progress.report(self._downloaded)
+
+
+def get_downloader(session, class_name, args, rate_limiter=None):
     """
     Decides which downloader to use.
+
+    @param rate_limiter: Limiter of the download rate, it is only obeyed
+        by the native downloader.
+    @type rate_limiter: ratelimit.RateLimiter
     """
 
     external = {
@@ -412,7 +737,11 @@ def get_downloader(session, class_name, args):
 
     for bin, class_ in external.items():
         if getattr(args, bin):
+            if rate_limiter is not None:
+                logging.warning('--max-rate is ignored by external '
+                                'downloaders, use their own options')
             return class_(session, bin=getattr(args, bin),
                           downloader_arguments=args.downloader_arguments)
 
-    return NativeDownloader(session)
+    return NativeDownloader(session, segments=args.segments,
+                            rate_limiter=rate_limiter)
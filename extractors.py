@@ -5,17 +5,150 @@ Usually they do not download heavy content, except when necessary
 to parse course syllabus.
 """
 
+import re
 import abc
-import json
 import logging
+import threading
+
+from collections import namedtuple
+from itertools import groupby
+from multiprocessing.dummy import Pool
 
 from api import (CourseraOnDemand, OnDemandCourseMaterialItemsV1,
-                 ModulesV1, LessonsV1, ItemsV2)
-from define import OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2
-from network import get_page
+                 ModulesV1, LessonsV1, ItemsV2, SessionMetadata)
+from define import IN_MEMORY_EXTENSION
+from filtering import FormatSelector
+from snapshot import SyllabusSnapshot, get_fingerprint
 from utils import is_debug_run, spit_json
 
 
+#: Lecture with extracted links. Indices identify the module and the section
+#: (lesson) the lecture belongs to and are only used to group lectures.
+ExtractedLecture = namedtuple(
+    'ExtractedLecture',
+    'module_index module section_index section lecture links')
+
+#: Item types that are extracted regardless of options
+CONTENT_TYPE_NAMES = ('lecture', 'supplement', 'phasedPeer',
+                      'gradedProgramming', 'ungradedProgramming')
+
+#: Item types that are extracted only with --download-quizzes
+QUIZ_TYPE_NAMES = ('quiz', 'exam', 'programming')
+
+
+def _filter_matches(pattern, name):
+    """
+    Check whether name passes a section or lecture filter the same way
+    as workflow does it.
+    """
+    return not pattern or re.search(pattern, name) is not None
+
+
+def _may_have_links(lecture, download_quizzes, download_notebooks):
+    """
+    Check whether extraction of an item may produce any links, without
+    making any requests.
+    """
+    typename = lecture.type_name
+    return (typename in CONTENT_TYPE_NAMES or
+            (download_quizzes and typename in QUIZ_TYPE_NAMES) or
+            (download_notebooks and typename == 'notebook'))
+
+
+def group_lectures(lectures):
+    """
+    Group lectures into the modules structure used by the downloader:
+    [(module, [(section, [(lecture, links), ...]), ...]), ...]
+
+    Grouping is lazy, modules, sections and lectures are iterators that are
+    valid as long as they are consumed in order. This allows downloading
+    to start before the whole syllabus has been extracted.
+
+    @param lectures: Iterable of ExtractedLecture in the syllabus order.
+    @type lectures: iterable
+
+    @return: Generator of modules.
+    @rtype: generator
+    """
+    def module_key(lecture):
+        return lecture.module_index, lecture.module
+
+    def section_key(lecture):
+        return lecture.section_index, lecture.section
+
+    for (_index, module), module_lectures in groupby(lectures, module_key):
+        sections = ((section, ((lecture.lecture, lecture.links)
+                               for lecture in section_lectures))
+                    for (_index, section), section_lectures
+                    in groupby(module_lectures, section_key))
+        yield module, sections
+
+
+def collect_modules(lectures):
+    """
+    Group lectures into modules like `group_lectures` does, but return
+    the whole structure as nested lists.
+
+    @param lectures: Iterable of ExtractedLecture in the syllabus order.
+    @type lectures: iterable
+
+    @return: Modules.
+    @rtype: list
+    """
+    return [(module, [(section, list(section_lectures))
+                      for section, section_lectures in sections])
+            for module, sections in group_lectures(lectures)]
+
+
+def build_syllabus(dom, reverse=False, get_section_item=None):
+    """
+    Build syllabus tree from the reply of
+    OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2. No requests are made.
+
+    @param dom: Parsed reply.
+    @type dom: dict
+
+    @param reverse: Reverse the order of modules. Sections and lectures
+        within modules keep their order.
+    @type reverse: bool
+
+    @param get_section_item: Function that returns the item of a section
+        without items (or None), @see OnDemandCourseMaterialItemsV1.get
+    @type get_section_item: callable
+
+    @return: [(ModuleV1, [(LessonV1, [ItemV2, ...]), ...]), ...]
+    @rtype: list
+    """
+    all_modules = ModulesV1.from_json(
+        dom['linked']['onDemandCourseMaterialModules.v1'])
+    all_lessons = LessonsV1.from_json(
+        dom['linked']['onDemandCourseMaterialLessons.v1'])
+    all_items = ItemsV2.from_json(
+        dom['linked']['onDemandCourseMaterialItems.v2'])
+
+    syllabus = []
+    for module in all_modules:
+        sections = []
+        for section in module.children(all_lessons):
+            available_lectures = section.children(all_items)
+
+            # Certain modules may be empty-looking programming assignments
+            # e.g. in data-structures, algorithms-on-graphs ondemand
+            # courses
+            if not available_lectures and get_section_item is not None:
+                lecture = get_section_item(section.id)
+                if lecture is not None:
+                    available_lectures = [lecture]
+
+            sections.append((section, available_lectures))
+        syllabus.append((module, sections))
+
+    if reverse:
+        syllabus.reverse()
+
+    return syllabus
+
+
 class PlatformExtractor(object):
     __metaclass__ = abc.ABCMeta
 
@@ -27,9 +160,36 @@ class PlatformExtractor(object):
 
 
 class CourseraExtractor(PlatformExtractor):
-    def __init__(self, session):
+    def __init__(self, session, extract_jobs=1, incremental=False,
+                 render_pool=None, defer_rendering=False, page_store=None,
+                 overwrite=False):
+        """
+        @param render_pool: Process pool to render quizzes and instructions
+            in, @see api.CourseraOnDemand.
+        @type render_pool: multiprocessing.Pool
+
+        @param defer_rendering: Whether pages should be left as markup
+            (IN_MARKUP_MARKER) to be rendered only when they are saved.
+        @type defer_rendering: bool
+
+        @param page_store: Store to keep contents of pages in,
+            @see api.CourseraOnDemand.
+        @type page_store: pagestore.PageStore
+
+        @param overwrite: Whether notebook files that differ from the
+            workspace should be replaced, @see api.CourseraOnDemand.
+        @type overwrite: bool
+        """
         self._notebook_downloaded = False
+        self._notebook_lock = threading.Lock()
+        self.error_occurred = False
         self._session = session
+        self._extract_jobs = extract_jobs
+        self._incremental = incremental
+        self._render_pool = render_pool
+        self._defer_rendering = defer_rendering
+        self._page_store = page_store
+        self._overwrite = overwrite
 
     def list_courses(self):
         """
@@ -47,63 +207,116 @@ class CourseraExtractor(PlatformExtractor):
                     reverse=False, unrestricted_filenames=False,
                     subtitle_language='en', video_resolution=None,
                     download_quizzes=False, mathjax_cdn_url=None,
-                    download_notebooks=False):
+                    download_notebooks=False,
+                    section_filter=None, lecture_filter=None,
+                    format_selector=None):
 
-        page = self._get_on_demand_syllabus(class_name)
-        error_occurred, modules = self._parse_on_demand_syllabus(
-            class_name,
-            page, reverse, unrestricted_filenames,
+        lectures = self.iter_lectures(
+            class_name, reverse, unrestricted_filenames,
             subtitle_language, video_resolution,
-            download_quizzes, mathjax_cdn_url, download_notebooks)
+            download_quizzes, mathjax_cdn_url, download_notebooks,
+            section_filter, lecture_filter, format_selector)
 
-        return error_occurred, modules
+        modules = collect_modules(lectures)
 
-    def _get_on_demand_syllabus(self, class_name):
+        return self.error_occurred, modules
+
+    def get_syllabus_structure(self, class_name, reverse=False):
         """
-        Get the on-demand course listing webpage.
+        Get modules, sections and items of the course without extracting
+        any links. Only the syllabus itself is downloaded.
+
+        @return: @see build_syllabus
+        @rtype: list
         """
+        dom = self._get_on_demand_syllabus(class_name)
+        items = OnDemandCourseMaterialItemsV1(
+            dom['linked']['onDemandCourseMaterialItems.v2'])
+        return build_syllabus(dom, reverse, items.get)
+
+    def iter_lectures(self, class_name,
+                      reverse=False, unrestricted_filenames=False,
+                      subtitle_language='en', video_resolution=None,
+                      download_quizzes=False, mathjax_cdn_url=None,
+                      download_notebooks=False,
+                      section_filter=None, lecture_filter=None,
+                      format_selector=None):
+        """
+        Iterate over course lectures, yielding each of them as soon as its
+        links have been extracted. Use `group_lectures` to turn the result
+        into modules. Errors are recorded in `error_occurred` attribute.
 
-        url = OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2.format(
-            class_name=class_name)
-        page = get_page(self._session, url)
-        logging.debug('Downloaded %s (%d bytes)', url, len(page))
+        Items that do not match section_filter or lecture_filter (regular
+        expressions matched against section and lecture slugs) are not
+        extracted at all. Likewise, links of formats that format_selector
+        (filtering.FormatSelector) does not want may be left out.
+
+        @return: Generator of ExtractedLecture.
+        @rtype: generator
+        """
+        dom = self._get_on_demand_syllabus(class_name)
+        return self._parse_on_demand_syllabus(
+            class_name,
+            dom, reverse, unrestricted_filenames,
+            subtitle_language, video_resolution,
+            download_quizzes, mathjax_cdn_url, download_notebooks,
+            section_filter, lecture_filter, format_selector)
 
-        return page
+    def _get_on_demand_syllabus(self, class_name):
+        """
+        Get the on-demand course listing.
 
-    def _parse_on_demand_syllabus(self, course_name, page, reverse=False,
+        @return: Parsed reply of OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2.
+        @rtype: dict
+        """
+        return SessionMetadata.of(self._session).get_syllabus(class_name)
+
+    def _parse_on_demand_syllabus(self, course_name, dom, reverse=False,
                                   unrestricted_filenames=False,
                                   subtitle_language='en',
                                   video_resolution=None,
                                   download_quizzes=False,
                                   mathjax_cdn_url=None,
-                                  download_notebooks=False
+                                  download_notebooks=False,
+                                  section_filter=None,
+                                  lecture_filter=None,
+                                  format_selector=None
                                   ):
         """
         Parse a Coursera on-demand course listing/syllabus page.
 
-        @return: Tuple of (bool, list), where bool indicates whether
-            there was at least on error while parsing syllabus, the list
-            is a list of parsed modules.
-        @rtype: (bool, list)
+        This is a generator, lectures are yielded in the syllabus order as
+        soon as their links are ready. Lectures without links are not
+        yielded; if extraction of a lecture fails, `error_occurred` is set.
+        Lectures skipped because of filters or formats are yielded without
+        links, so that numbering of the rest does not depend on them.
+
+        @return: Generator of ExtractedLecture.
+        @rtype: generator
         """
 
-        dom = json.loads(page)
+        if format_selector is None:
+            format_selector = FormatSelector()
+
         class_id = dom['elements'][0]['id']
 
         logging.info('Parsing syllabus of on-demand course (id=%s). '
                      'This may take some time, please be patient ...',
                      class_id)
-        modules = []
 
         json_modules = dom['linked']['onDemandCourseMaterialItems.v2']
         course = CourseraOnDemand(
             session=self._session, course_id=class_id,
             course_name=course_name,
             unrestricted_filenames=unrestricted_filenames,
-            mathjax_cdn_url=mathjax_cdn_url)
+            mathjax_cdn_url=mathjax_cdn_url,
+            format_selector=format_selector,
+            render_pool=self._render_pool,
+            defer_rendering=self._defer_rendering,
+            page_store=self._page_store,
+            overwrite=self._overwrite)
         course.obtain_user_id()
-        ondemand_material_items = OnDemandCourseMaterialItemsV1.create(
-            session=self._session, course_name=course_name)
+        ondemand_material_items = OnDemandCourseMaterialItemsV1(json_modules)
 
         if is_debug_run():
             spit_json(dom, '%s-syllabus-raw.json' % course_name)
@@ -111,134 +324,276 @@ class CourseraExtractor(PlatformExtractor):
             spit_json(ondemand_material_items._items,
                       '%s-course-material-items.json' % course_name)
 
-        error_occurred = False
-
-        all_modules = ModulesV1.from_json(
-            dom['linked']['onDemandCourseMaterialModules.v1'])
-        all_lessons = LessonsV1.from_json(
-            dom['linked']['onDemandCourseMaterialLessons.v1'])
-        all_items = ItemsV2.from_json(
-            dom['linked']['onDemandCourseMaterialItems.v2'])
-
-        for module in all_modules:
+        self.error_occurred = False
+
+        # Collect all items of the syllabus first, so that their links can
+        # be extracted concurrently while the order of modules, sections and
+        # lectures stays the same as in the syllabus.
+        syllabus = build_syllabus(dom, reverse, ondemand_material_items.get)
+        syllabus_items = []
+
+        def is_wanted(section, lecture):
+            return (_filter_matches(section_filter, section.slug) and
+                    _filter_matches(lecture_filter, lecture.slug))
+
+        for _module, sections in syllabus:
+            for section, available_lectures in sections:
+                syllabus_items.extend(
+                    lecture for lecture in available_lectures
+                    if is_wanted(section, lecture))
+        skipped_count = 0
+
+        # In incremental mode only new or changed items are extracted,
+        # links of the rest are taken from the snapshot of previous run
+        snapshot = None
+        if self._incremental:
+            snapshot = SyllabusSnapshot.load(course_name, {
+                'unrestricted_filenames': unrestricted_filenames,
+                'subtitle_language': subtitle_language,
+                'video_resolution': video_resolution,
+                'download_quizzes': download_quizzes,
+                'mathjax_cdn_url': mathjax_cdn_url,
+                'download_notebooks': download_notebooks,
+                'file_formats': format_selector.file_formats,
+                'ignored_formats': format_selector.ignored_formats})
+        item_jsons = dict((item['id'], item) for item in json_modules)
+
+        def extract_item(lecture):
+            if snapshot is None:
+                return self._extract_links_from_item(
+                    course, class_id, lecture,
+                    subtitle_language, video_resolution,
+                    download_quizzes, download_notebooks,
+                    format_selector)
+
+            fingerprint = get_fingerprint(item_jsons.get(lecture.id))
+            links = snapshot.get_links(lecture.id, fingerprint)
+            if links is None:
+                links = self._extract_links_from_item(
+                    course, class_id, lecture,
+                    subtitle_language, video_resolution,
+                    download_quizzes, download_notebooks,
+                    format_selector)
+                snapshot.put_links(lecture.id, fingerprint,
+                                   lecture.type_name, lecture.slug, links)
+            else:
+                logging.info('Unchanged lecture          %s (%s)',
+                             lecture.slug, lecture.type_name)
+            return links
+
+        all_links = self._map_items(extract_item, syllabus_items)
+
+        # When some formats are left out, items may end up without links
+        # although they would have had them otherwise. Such items are kept
+        # as placeholders so that numbering does not depend on formats.
+        keep_placeholders = not format_selector.wants_everything()
+
+        for module_index, (module, sections) in enumerate(syllabus):
             logging.info('Processing module  %s', module.slug)
-            lessons = []
-            for section in module.children(all_lessons):
+            for section_index, (section, available_lectures) in \
+                    enumerate(sections):
                 logging.info('Processing section     %s', section.slug)
-                lectures = []
-                available_lectures = section.children(all_items)
-
-                # Certain modules may be empty-looking programming assignments
-                # e.g. in data-structures, algorithms-on-graphs ondemand
-                # courses
-                if not available_lectures:
-                    lecture = ondemand_material_items.get(section.id)
-                    if lecture is not None:
-                        available_lectures = [lecture]
 
                 for lecture in available_lectures:
-                    typename = lecture.type_name
-
-                    logging.info('Processing lecture         %s (%s)',
-                                 lecture.slug, typename)
-                    # Empty dictionary means there were no data
-                    # None means an error occurred
-                    links = {}
-
-                    if typename == 'lecture':
-                        # lecture_video_id = lecture['content']['definition']['videoId']
-                        # assets = lecture['content']['definition'].get(
-                        #     'assets', [])
-                        lecture_video_id = lecture.id
-                        # assets = []
-
-                        links = course.extract_links_from_lecture(
-                            class_id,
-                            lecture_video_id, subtitle_language,
-                            video_resolution)
-
-                    elif typename == 'supplement':
-                        links = course.extract_links_from_supplement(
-                            lecture.id)
-
-                    elif typename == 'phasedPeer':
-                        links = course.extract_links_from_peer_assignment(
-                            lecture.id)
-
-                    elif typename in ('gradedProgramming', 'ungradedProgramming'):
-                        links = course.extract_links_from_programming(
-                            lecture.id)
-
-                    elif typename == 'quiz':
-                        if download_quizzes:
-                            links = course.extract_links_from_quiz(
-                                lecture.id)
-                            
-                    elif typename == 'staffGraded':
-                        logging.info(
-                            'Staff graded assignment skipped: "%s" in lecture "%s" (lecture id "%s")',
-                            lecture.slug, lecture.slug, lecture.id)
-
-                    elif typename == 'exam':
-                        if download_quizzes:
-                            links = course.extract_links_from_exam(
-                                lecture.id)
-
-                    elif typename == 'programming':
-                        if download_quizzes:
-                            links = course.extract_links_from_programming_immediate_instructions(
-                                lecture.id)
-
-                    elif typename == 'notebook':
-                        if download_notebooks and not self._notebook_downloaded:
-                            logging.warning(
-                                'According to notebooks platform, content will be downloaded first')
-                            links = course.extract_links_from_notebook(
-                                lecture.id)
-                            self._notebook_downloaded = True
-
-                    else:
-                        logging.info(
-                            'Unsupported typename "%s" in lecture "%s" (lecture id "%s")',
-                            typename, lecture.slug, lecture.id)
+                    if not is_wanted(section, lecture):
+                        logging.debug('Skipping b/c of filters: %s %s',
+                                      section.slug, lecture.slug)
+                        skipped_count += 1
+                        if snapshot is not None:
+                            snapshot.keep_links(lecture.id)
+                        if _may_have_links(lecture, download_quizzes,
+                                           download_notebooks):
+                            yield ExtractedLecture(
+                                module_index, module.slug,
+                                section_index, section.slug,
+                                lecture.slug, {})
                         continue
 
-                    if links is None:
-                        error_occurred = True
-                    elif links:
-                        lectures.append((lecture.slug, links))
-
-                if lectures:
-                    lessons.append((section.slug, lectures))
-
-            if lessons:
-                modules.append((module.slug, lessons))
+                    links = next(all_links)
 
-        if modules and reverse:
-            modules.reverse()
-
-        # Processing resources section
-        json_references = course.extract_references_poll()
-        references = []
+                    if links is None:
+                        self.error_occurred = True
+                    elif links or (keep_placeholders and _may_have_links(
+                            lecture, download_quizzes, download_notebooks)):
+                        yield ExtractedLecture(
+                            module_index, module.slug,
+                            section_index, section.slug,
+                            lecture.slug, links)
+
+        # Processing resources section. Resources have no lecture names,
+        # so a lecture filter that does not match an empty name skips
+        # all of them
+        json_references = None
+        if _filter_matches(lecture_filter, '') and \
+                not format_selector.wants_only_subtitles():
+            json_references = course.extract_references_poll()
         if json_references:
             logging.info('Processing resources')
-            for json_reference in json_references:
-                reference = []
+            for reference_index, json_reference in enumerate(json_references):
                 reference_slug = json_reference['slug']
+                reference_id = 'reference~%s' % json_reference['shortId']
+
+                if not _filter_matches(section_filter, reference_slug):
+                    logging.debug('Skipping b/c of sf: %s %s',
+                                  section_filter, reference_slug)
+                    skipped_count += 1
+                    if snapshot is not None:
+                        snapshot.keep_links(reference_id)
+                    yield ExtractedLecture(
+                        len(syllabus), 'Resources',
+                        reference_index, reference_slug,
+                        '', {})
+                    continue
+
                 logging.info('Processing resource  %s',
                              reference_slug)
 
-                links = course.extract_links_from_reference(
-                    json_reference['shortId'])
+                links = None
+                if snapshot is not None:
+                    fingerprint = get_fingerprint(json_reference)
+                    links = snapshot.get_links(reference_id, fingerprint)
+
                 if links is None:
-                    error_occurred = True
-                elif links:
-                    reference.append(('', links))
+                    links = course.extract_links_from_reference(
+                        json_reference['shortId'])
+                    if snapshot is not None:
+                        snapshot.put_links(reference_id, fingerprint,
+                                           'reference', reference_slug,
+                                           links)
 
-                if reference:
-                    references.append((reference_slug, reference))
+                if links is None:
+                    self.error_occurred = True
+                elif links:
+                    yield ExtractedLecture(
+                        len(syllabus), 'Resources',
+                        reference_index, reference_slug,
+                        '', links)
+
+        if skipped_count:
+            logging.info('Skipped %d items that do not match section or '
+                         'lecture filters', skipped_count)
+
+        if snapshot is not None:
+            snapshot.save()
+            logging.info('Extracted %d new or changed items, reused links '
+                         'of %d unchanged items',
+                         snapshot.extracted_count, snapshot.reused_count)
+
+    def _map_items(self, function, items):
+        """
+        Apply function to every syllabus item. When more than one extraction
+        job is configured, items are processed by a pool of threads.
 
-        if references:
-            modules.append(("Resources", references))
+        @return: Generator of results in the same order as items.
+        @rtype: generator
+        """
+        if self._extract_jobs <= 1 or len(items) <= 1:
+            for item in items:
+                yield function(item)
+            return
+
+        pool = Pool(processes=min(self._extract_jobs, len(items)))
+        try:
+            for result in pool.imap(function, items):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _extract_links_from_item(self, course, class_id, lecture,
+                                 subtitle_language, video_resolution,
+                                 download_quizzes, download_notebooks,
+                                 format_selector):
+        """
+        Extract links from a single syllabus item (lecture, supplement, quiz
+        and so on). This method may be called from several threads at once.
 
-        return error_occurred, modules
+        @return: Dictionary with links (@see
+            CourseraOnDemand._extract_links_from_text), an empty dictionary
+            if there were no data or None if an error occurred.
+        @rtype: dict or None
+        """
+        typename = lecture.type_name
+
+        logging.info('Processing lecture         %s (%s)',
+                     lecture.slug, typename)
+        # Empty dictionary means there were no data
+        # None means an error occurred
+        links = {}
+
+        # Only lectures have subtitles, and quizzes are saved
+        # only as HTML pages
+        if (typename != 'lecture' and
+                format_selector.wants_only_subtitles()) or \
+                (typename in ('quiz', 'exam') and
+                 not format_selector.wants(IN_MEMORY_EXTENSION)):
+            logging.info('Skipping lecture           %s (%s) b/c of formats',
+                         lecture.slug, typename)
+            return links
+
+        if typename == 'lecture':
+            # lecture_video_id = lecture['content']['definition']['videoId']
+            # assets = lecture['content']['definition'].get(
+            #     'assets', [])
+            lecture_video_id = lecture.id
+            # assets = []
+
+            links = course.extract_links_from_lecture(
+                class_id,
+                lecture_video_id, subtitle_language,
+                video_resolution)
+
+        elif typename == 'supplement':
+            links = course.extract_links_from_supplement(
+                lecture.id)
+
+        elif typename == 'phasedPeer':
+            links = course.extract_links_from_peer_assignment(
+                lecture.id)
+
+        elif typename in ('gradedProgramming', 'ungradedProgramming'):
+            links = course.extract_links_from_programming(
+                lecture.id)
+
+        elif typename == 'quiz':
+            if download_quizzes:
+                links = course.extract_links_from_quiz(
+                    lecture.id)
+
+        elif typename == 'staffGraded':
+            logging.info(
+                'Staff graded assignment skipped: "%s" in lecture "%s" (lecture id "%s")',
+                lecture.slug, lecture.slug, lecture.id)
+
+        elif typename == 'exam':
+            if download_quizzes:
+                links = course.extract_links_from_exam(
+                    lecture.id)
+
+        elif typename == 'programming':
+            if download_quizzes:
+                links = course.extract_links_from_programming_immediate_instructions(
+                    lecture.id)
+
+        elif typename == 'notebook':
+            # Notebook workspace is shared by the whole course, so it is
+            # downloaded only once
+            with self._notebook_lock:
+                download_notebook = (download_notebooks and
+                                     not self._notebook_downloaded)
+                if download_notebook:
+                    self._notebook_downloaded = True
+
+            if download_notebook:
+                logging.warning(
+                    'According to notebooks platform, content will be downloaded first')
+                links = course.extract_links_from_notebook(
+                    lecture.id)
+
+        else:
+            logging.info(
+                'Unsupported typename "%s" in lecture "%s" (lecture id "%s")',
+                typename, lecture.slug, lecture.id)
+
+        return links
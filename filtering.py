@@ -80,6 +80,89 @@ def skip_format_url(format_, url):
     return False
 
 
+#: Formats of subtitles and transcripts of lecture videos, they are
+#: prefixed with a language (e.g. "en.srt")
+SUBTITLE_FORMATS = ('srt', 'txt')
+
+
+class FormatSelector(object):
+    """
+    Selection of formats (file extensions) according to --formats and
+    --ignore-formats. It is used to select resources to download and by
+    extractors to avoid extracting links that would be thrown away anyway.
+    """
+
+    def __init__(self, file_formats=None, ignored_formats=None):
+        """
+        @param file_formats: Formats to download, may contain special
+            value "all".
+        @type file_formats: [str]
+
+        @param ignored_formats: Formats not to download.
+        @type ignored_formats: [str]
+        """
+        self.file_formats = ['all'] if file_formats is None else file_formats
+        self.ignored_formats = ignored_formats or []
+
+    @staticmethod
+    def _short_format(fmt):
+        # Formats like "en.srt" are also matched by their "srt" part
+        if '.' in fmt:
+            return fmt.split('.')[1]
+        return None
+
+    def _covers(self, fmt, suffix):
+        return fmt == suffix or self._short_format(fmt) == suffix
+
+    def is_ignored(self, fmt):
+        short_fmt = self._short_format(fmt)
+        return fmt in self.ignored_formats or \
+            (short_fmt is not None and short_fmt in self.ignored_formats)
+
+    def is_requested(self, fmt):
+        short_fmt = self._short_format(fmt)
+        return fmt in self.file_formats or \
+            (short_fmt is not None and short_fmt in self.file_formats) or \
+            'all' in self.file_formats
+
+    def wants(self, fmt):
+        """
+        Check whether resources of the format are going to be downloaded.
+        """
+        return self.is_requested(fmt) and not self.is_ignored(fmt)
+
+    def wants_suffix(self, suffix):
+        """
+        Check whether resources of any format that ends with suffix
+        (e.g. "srt" for "en.srt", "fr.srt" and so on) may be downloaded.
+        Prefixed formats are matched by their suffix as in is_requested
+        and is_ignored.
+        """
+        if suffix in self.ignored_formats:
+            return False
+        if 'all' in self.file_formats:
+            return True
+        return any(self._covers(fmt, suffix) and
+                   fmt not in self.ignored_formats
+                   for fmt in self.file_formats)
+
+    def wants_only_subtitles(self):
+        """
+        Check whether only subtitles or transcripts in given languages
+        (e.g. "en.srt") may be downloaded. Formats of other resources are
+        plain file extensions, so such a selection cannot match anything
+        but subtitles of lecture videos, whereas "srt", "txt" or "mp4" may
+        match attachments of any item.
+        """
+        if 'all' in self.file_formats:
+            return False
+        return all('.' in fmt and self._short_format(fmt) in SUBTITLE_FORMATS
+                   for fmt in self.file_formats)
+
+    def wants_everything(self):
+        return 'all' in self.file_formats and not self.ignored_formats
+
+
 def find_resources_to_get(lecture, file_formats, resource_filter, ignored_formats=None):
     """
     Select formats to download.
@@ -92,17 +175,15 @@ def find_resources_to_get(lecture, file_formats, resource_filter, ignored_format
     if len(ignored_formats):
         logging.info("The following file formats will be ignored: " + ",".join(ignored_formats))
 
+    selector = FormatSelector(file_formats, ignored_formats)
+
     for fmt, resources in lecture.items():
         fmt0 = fmt
 
-        short_fmt = None
-        if '.' in fmt:
-            short_fmt = fmt.split('.')[1]
-
-        if fmt in ignored_formats or (short_fmt != None and short_fmt in ignored_formats) :
+        if selector.is_ignored(fmt):
             continue
 
-        if fmt in file_formats or (short_fmt != None and short_fmt in file_formats) or 'all' in file_formats:
+        if selector.is_requested(fmt):
             for r in resources:
                 if resource_filter and r[1] and not re.search(resource_filter, r[1]):
                     logging.debug('Skipping b/c of rf: %s %s',
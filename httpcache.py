@@ -0,0 +1,280 @@
+"""
+This module contains a persistent cache of HTTP responses. It is used by
+`network.get_reply` to avoid downloading the same API replies (syllabus,
+lecture videos, assets, supplements and so on) on every run.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from define import PATH_HTTP_CACHE, HTTP_CACHE_TTLS
+from utils import mkdir_p
+
+# Signed URLs inside replies expire, replies must not outlive them.
+# Both CloudFront style "Expires=<seconds>" query parameters and
+# "expires": <milliseconds> JSON fields are recognized.
+RE_EXPIRES_PARAM = re.compile(r'[?&]Expires=(\d{10})\b')
+RE_EXPIRES_FIELD = re.compile(r'"expires"\s*:\s*(\d{13})\b')
+
+#: Replies are considered expired this many seconds before the earliest
+#: expiration time of signed URLs they contain
+EXPIRES_MARGIN = 15 * 60
+
+#: Headers of replies that are stored in the cache
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of HTTP responses keyed by method, URL, request body and
+    the account (CAUTH cookie) the request is made for.
+
+    Every endpoint has its own time to live (see HTTP_CACHE_TTLS), replies
+    of endpoints that are not listed are never cached. Stale replies are
+    revalidated with If-None-Match/If-Modified-Since when the server
+    provided ETag/Last-Modified headers. The total size of the cache is
+    limited, least recently used replies are evicted first.
+    """
+
+    def __init__(self, path=PATH_HTTP_CACHE, max_size=200 * 1024 * 1024,
+                 ttls=HTTP_CACHE_TTLS):
+        """
+        @param path: Directory to keep cached replies in.
+        @type path: str
+
+        @param max_size: Maximum total size of cached replies in bytes.
+        @type max_size: int
+
+        @param ttls: List of (URL regex, time to live in seconds) pairs.
+        @type ttls: [(str, int)]
+        """
+        self._path = path
+        self._max_size = max_size
+        self._ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self._lock = threading.Lock()
+        self._size = None
+
+        mkdir_p(self._path, 0o700)
+
+    def get_ttl(self, method, url):
+        """
+        Return time to live of replies to the given request or None if
+        they must not be cached.
+        """
+        if method != 'GET':
+            return None
+
+        for pattern, ttl in self._ttls:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def lookup(self, session, method, url, data=None):
+        """
+        Find cached reply to the given request.
+
+        @return: Cache entry or None if there is none.
+        @rtype: CacheEntry
+        """
+        key = self._make_key(session, method, url, data)
+        meta_filename, body_filename = self._get_filenames(key)
+
+        try:
+            with open(meta_filename) as file_object:
+                meta = json.load(file_object)
+            with open(body_filename, 'rb') as file_object:
+                body = file_object.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        # Mark entry as recently used
+        self._touch(meta_filename)
+        return CacheEntry(key, meta, body)
+
+    def store(self, session, method, url, data, reply):
+        """
+        Store reply to the given request if its endpoint is cacheable.
+        """
+        ttl = self.get_ttl(method, url)
+        if ttl is None or reply.status_code != 200:
+            return
+
+        now = time.time()
+        body = reply.content
+        meta = {
+            'url': url,
+            'stored': now,
+            'expires': now + min(ttl, self._get_body_ttl(body, now)),
+            'encoding': reply.encoding,
+            'headers': dict((name, reply.headers[name])
+                            for name in STORED_HEADERS
+                            if name in reply.headers),
+        }
+
+        key = self._make_key(session, method, url, data)
+        meta_filename, body_filename = self._get_filenames(key)
+        # A replaced entry no longer takes space
+        try:
+            old_size = os.path.getsize(body_filename)
+        except OSError:
+            old_size = 0
+        self._write(body_filename, body)
+        self._write(meta_filename, json.dumps(meta).encode('utf-8'))
+
+        self._add_size(len(body) - old_size)
+
+    def refresh(self, entry):
+        """
+        Extend lifetime of an entry that has been successfully revalidated.
+        """
+        now = time.time()
+        ttl = self.get_ttl('GET', entry.meta['url']) or 0
+        entry.meta['stored'] = now
+        entry.meta['expires'] = now + min(
+            ttl, self._get_body_ttl(entry.body, now))
+
+        meta_filename, _body_filename = self._get_filenames(entry.key)
+        self._write(meta_filename, json.dumps(entry.meta).encode('utf-8'))
+
+    def _get_body_ttl(self, body, now):
+        """
+        Return for how long a body may be cached considering signed URLs
+        it contains.
+        """
+        text = body.decode('utf-8', 'replace')
+        expiration_times = [int(value) for value
+                            in RE_EXPIRES_PARAM.findall(text)]
+        expiration_times.extend(int(value) // 1000 for value
+                                in RE_EXPIRES_FIELD.findall(text))
+        if not expiration_times:
+            return float('inf')
+        return max(0, min(expiration_times) - EXPIRES_MARGIN - now)
+
+    def _make_key(self, session, method, url, data):
+        digest = hashlib.sha1()
+        for part in (session.cookies.get('CAUTH') or '', method, url,
+                     data or ''):
+            if not isinstance(part, bytes):
+                part = str(part).encode('utf-8')
+            digest.update(part)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _get_filenames(self, key):
+        filename = os.path.join(self._path, key)
+        return filename + '.json', filename + '.body'
+
+    def _write(self, filename, content):
+        # Write to a temporary file first, so that readers never see
+        # partially written entries
+        temp_filename = '%s.%s.tmp' % (filename, threading.current_thread().ident)
+        with open(temp_filename, 'wb') as file_object:
+            file_object.write(content)
+        os.replace(temp_filename, filename)
+
+    def _touch(self, filename):
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+    def _add_size(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _key, _mtime, size
+                                 in self._list_entries())
+            else:
+                self._size += size
+
+            if self._size > self._max_size:
+                self._evict()
+
+    def _list_entries(self):
+        """
+        Return list of (key, last use time, size) of cached entries.
+        """
+        entries = []
+        for filename in os.listdir(self._path):
+            key, extension = os.path.splitext(filename)
+            if extension != '.json':
+                continue
+            meta_filename, body_filename = self._get_filenames(key)
+            try:
+                entries.append((key,
+                                os.path.getmtime(meta_filename),
+                                os.path.getsize(body_filename)))
+            except OSError:
+                pass
+        return entries
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache fits into
+        its maximum size (with some headroom).
+        """
+        entries = sorted(self._list_entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _key, _mtime, size in entries)
+        target_size = self._max_size * 0.9
+
+        for key, _mtime, size in entries:
+            if self._size <= target_size:
+                break
+            for filename in self._get_filenames(key):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            self._size -= size
+            logging.debug('Evicted %s from HTTP cache', key)
+
+
+class CacheEntry(object):
+    """
+    Cached reply.
+    """
+
+    def __init__(self, key, meta, body):
+        self.key = key
+        self.meta = meta
+        self.body = body
+
+    def is_fresh(self):
+        return time.time() < self.meta['expires']
+
+    def add_conditional_headers(self, headers):
+        """
+        Add headers that let the server reply with 304 Not Modified if
+        the cached reply is still valid.
+
+        @return: True if any headers were added.
+        @rtype: bool
+        """
+        etag = self.meta['headers'].get('ETag')
+        last_modified = self.meta['headers'].get('Last-Modified')
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return bool(etag or last_modified)
+
+    def to_response(self, request=None):
+        """
+        Turn entry into requests.Response.
+        """
+        reply = requests.models.Response()
+        reply.status_code = 200
+        reply.reason = 'OK'
+        reply.url = self.meta['url']
+        reply.headers = CaseInsensitiveDict(self.meta['headers'])
+        reply.encoding = self.meta['encoding']
+        reply.request = request
+        reply._content = self.body
+        return reply
@@ -1,6 +1,7 @@
 __version__ = "3.0.1"
 
 import sys, requests
+import multiprocessing
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QRadioButton,
     QComboBox, QFileDialog, QMessageBox, QVBoxLayout, QHBoxLayout, QGridLayout, QAction, QGroupBox, QTextBrowser
@@ -363,7 +364,7 @@ class MainWindow(QMainWindow):
         cmd.append('--unrestricted-filenames')
         cmd.append('--combined-section-lectures-nums')
         cmd.append('--jobs')
-        cmd.append('1')
+        cmd.append('auto')
 
         if self.shouldResume:
             cmd.append("--resume")
@@ -395,6 +396,9 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    # Markup may be rendered in worker processes (--render-jobs)
+    multiprocessing.freeze_support()
+
     # FIX: Add these two lines to enable High DPI scaling
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
     QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
@@ -8,8 +8,26 @@ import logging
 
 import requests
 
+# Optional persistent cache of replies, see set_response_cache
+_response_cache = None
 
-def get_reply(session, url, post=False, data=None, headers=None, quiet=False):
+# Projected URL templates rejected by the server, see get_projected_page
+_rejected_projections = set()
+
+
+def set_response_cache(cache):
+    """
+    Enable (or disable when cache is None) caching of replies in get_reply.
+
+    @param cache: Response cache.
+    @type cache: httpcache.ResponseCache
+    """
+    global _response_cache
+    _response_cache = cache
+
+
+def get_reply(session, url, post=False, data=None, headers=None, quiet=False,
+              timeout=None):
     """
     Download an HTML page using the requests session. Low-level function
     that allows for flexible request configuration.
@@ -33,19 +51,41 @@ def get_reply(session, url, post=False, data=None, headers=None, quiet=False):
         code != 200.
     @type quiet: bool
 
+    @param timeout: Number of seconds to wait for the server, by default
+        there is no limit.
+    @type timeout: float
+
     @return: Requests response.
     @rtype: requests.Response
     """
 
     request_headers = {} if headers is None else headers
-
-    request = requests.Request('POST' if post else 'GET',
+    method = 'POST' if post else 'GET'
+
+    cache = _response_cache
+    entry = None
+    if cache is not None and cache.get_ttl(method, url) is not None:
+        entry = cache.lookup(session, method, url, data)
+        if entry is not None:
+            if entry.is_fresh():
+                logging.debug('Using cached reply for %s', url)
+                return entry.to_response()
+            request_headers = dict(request_headers)
+            if not entry.add_conditional_headers(request_headers):
+                entry = None
+
+    request = requests.Request(method,
                                url,
                                data=data,
                                headers=request_headers)
     prepared_request = session.prepare_request(request)
 
-    reply = session.send(prepared_request)
+    reply = session.send(prepared_request, timeout=timeout)
+
+    if entry is not None and reply.status_code == 304:
+        logging.debug('Cached reply for %s is still valid', url)
+        cache.refresh(entry)
+        return entry.to_response(prepared_request)
 
     try:
         reply.raise_for_status()
@@ -55,6 +95,9 @@ def get_reply(session, url, post=False, data=None, headers=None, quiet=False):
         #     logging.error("The server replied: %s", reply.text)
         raise
 
+    if cache is not None:
+        cache.store(session, method, url, data, reply)
+
     return reply
 
 
@@ -93,6 +136,53 @@ def get_page(session,
     return reply.json() if json else reply.text
 
 
+def get_projected_page(session,
+                       url,
+                       full_url,
+                       json=False,
+                       quiet=False,
+                       **kwargs):
+    """
+    Download a page using a projected URL template, i.e. the one that asks
+    only for fields that are actually used. If the server replies with 400
+    Bad Request naming the projection parameters (fields or includes), the
+    projected template is given up and the full URL template is used for
+    this and all following calls. Other 400 replies are caused by the
+    arguments (e.g. an unknown slug) and are raised without retrying.
+
+    @param url: Projected URL pattern with optional keywords to format.
+    @type url: str
+
+    @param full_url: Full URL pattern with the same keywords.
+    @type full_url: str
+
+    @return: @see get_page
+    """
+    if url in _rejected_projections:
+        return get_page(session, full_url, json=json, quiet=quiet, **kwargs)
+
+    try:
+        return get_page(session, url, json=json, quiet=True, **kwargs)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 400 or \
+                not _names_projection(e.response):
+            raise
+        logging.debug('Projection has been rejected (%s), falling back '
+                      'to the full URL: %s', e, url)
+        _rejected_projections.add(url)
+
+    return get_page(session, full_url, json=json, quiet=quiet, **kwargs)
+
+
+def _names_projection(reply):
+    """
+    Check whether an error reply blames the projection parameters of the
+    request (fields or includes).
+    """
+    text = (reply.text or '').lower()
+    return 'fields' in text or 'includes' in text
+
+
 def get_page_and_url(session, url):
     """
     Download an HTML page using the requests session and return
@@ -0,0 +1,212 @@
+"""
+This module contains synchronization of Jupyter notebook workspaces of
+courses. Directory listings and files are fetched in parallel over the
+session of the course, files are streamed to disk and files that are
+already present are not fetched at all.
+"""
+
+import os
+import time
+import logging
+import threading
+
+from collections import namedtuple
+from multiprocessing.dummy import Pool
+
+import requests
+
+from define import OPENCOURSE_NOTEBOOK_TREE, OPENCOURSE_NOTEBOOK_DOWNLOAD
+from downloaders import format_bytes
+from network import get_page
+from utils import clean_filename, clean_url, mkdir_p
+
+
+#: File of a notebook workspace. Format and title describe the link of the
+#: file, size is None if the server does not report it.
+NotebookFile = namedtuple(
+    'NotebookFile', 'url filename head tail size format title')
+
+
+class NotebookWorkspace(object):
+    """
+    Jupyter notebook workspace of a course. Files are saved into
+    <course name>/notebook in the current directory.
+    """
+
+    #: Number of directory listings and file downloads run in parallel
+    JOBS = 4
+
+    #: Number of seconds to wait for the server
+    TIMEOUT = 60
+
+    def __init__(self, session, course_name, jupyter_id, jobs=JOBS,
+                 overwrite=False):
+        """
+        @param session: Current session that holds cookies and so on.
+        @type session: requests.Session
+
+        @param course_name: Course name (slug).
+        @type course_name: str
+
+        @param jupyter_id: Id of the workspace (user name in the hub).
+        @type jupyter_id: str
+
+        @param jobs: Number of parallel requests.
+        @type jobs: int
+
+        @param overwrite: Whether local files that differ from the
+            workspace should be replaced. They may have been edited, so by
+            default they are kept.
+        @type overwrite: bool
+        """
+        self._session = session
+        self._jupyter_id = jupyter_id
+        self._path = os.path.join(course_name, 'notebook')
+        self._jobs = jobs
+        self._overwrite = overwrite
+
+        self._lock = threading.Lock()
+        self._done_count = 0
+        self._file_count = 0
+
+    def sync(self):
+        """
+        Download files of the workspace that are missing locally, or whose
+        size has changed if existing files may be overwritten.
+
+        @return: Links of the files, @see
+            CourseraOnDemand._extract_links_from_text
+        @rtype: dict
+        """
+        pool = Pool(processes=self._jobs)
+        try:
+            files = self._list_files(pool)
+            self._done_count = 0
+            self._file_count = len(files)
+            results = pool.map(self._sync_file, files)
+        finally:
+            pool.close()
+            pool.join()
+
+        logging.info('Notebook workspace: %d files downloaded, %d skipped, '
+                     '%d failed', results.count(True), results.count(None),
+                     results.count(False))
+
+        supplement_links = {}
+        for notebook_file in files:
+            supplement_links.setdefault(notebook_file.format, []).append(
+                (notebook_file.url, notebook_file.title))
+        return supplement_links
+
+    def _list_files(self, pool):
+        """
+        List all files of the workspace. Directories of the same depth are
+        listed in parallel.
+
+        @return: Files in the depth-first order of the tree.
+        @rtype: [NotebookFile]
+        """
+        listings = {}
+        paths = ['/']
+        while paths:
+            level = pool.map(self._list_directory, paths)
+            listings.update(zip(paths, level))
+            paths = [content['path']
+                     for contents in level
+                     for content in contents
+                     if content['type'] == 'directory' and
+                     content['path'] not in listings]
+
+        files = []
+        self._collect_files(listings, '/', files)
+        return files
+
+    def _list_directory(self, path):
+        reply = get_page(self._session, OPENCOURSE_NOTEBOOK_TREE, json=True,
+                         jupId=self._jupyter_id, path=path,
+                         timestamp=int(time.time()))
+        return reply['content']
+
+    def _collect_files(self, listings, path, files):
+        for content in listings[path]:
+            if content['type'] == 'directory':
+                self._collect_files(listings, content['path'], files)
+            elif content['type'] in ('file', 'notebook'):
+                files.append(self._make_file(content))
+            else:
+                logging.info(
+                    'Unsupported typename %s in notebook', content['type'])
+
+    def _make_file(self, content):
+        url = OPENCOURSE_NOTEBOOK_DOWNLOAD.format(
+            path=content['path'], jupId=self._jupyter_id,
+            timestamp=int(time.time()))
+        title, extension = os.path.splitext(clean_url(url))
+
+        head, tail = os.path.split(content['path'])
+        if content['type'] == 'file':
+            # Paths come from a web page, so the separator is always '/'
+            # (https://github.com/coursera-dl/coursera-dl/pull/654)
+            head = '/'.join([clean_filename(dir, minimal_change=True)
+                             for dir in head.split('/')])
+            tail = clean_filename(tail, minimal_change=True)
+            fmt = str(extension[1:])
+        else:
+            fmt = 'ipynb'
+
+        return NotebookFile(url=url.replace(' ', '%20'),
+                            filename=os.path.join(self._path, head, tail),
+                            head=head,
+                            tail=tail,
+                            size=content.get('size'),
+                            format=fmt,
+                            title=title)
+
+    def _sync_file(self, notebook_file):
+        """
+        Download a file unless it is already there.
+
+        @return: True if the file has been downloaded, None if it has been
+            skipped and False if it could not be downloaded.
+        @rtype: bool
+        """
+        filename = notebook_file.filename
+        if os.path.exists(filename):
+            if notebook_file.size is None or \
+                    os.path.getsize(filename) == notebook_file.size:
+                logging.info('Skipping %s... (file exists)',
+                             notebook_file.tail)
+                return None
+            if not self._overwrite:
+                logging.warning('Skipping %s... (local file differs from '
+                                'the workspace, use --overwrite to '
+                                'replace it)', filename)
+                return None
+
+        mkdir_p(os.path.dirname(filename))
+        temp_filename = '%s.%s.tmp' % (
+            filename, threading.current_thread().ident)
+        try:
+            size = 0
+            with self._session.get(notebook_file.url, stream=True,
+                                   timeout=self.TIMEOUT) as reply:
+                reply.raise_for_status()
+                with open(temp_filename, 'wb') as file_object:
+                    for chunk in reply.iter_content(chunk_size=65536):
+                        file_object.write(chunk)
+                        size += len(chunk)
+            os.replace(temp_filename, filename)
+        except (requests.exceptions.RequestException, IOError) as e:
+            logging.error('Could not download %s into %s: %s',
+                          notebook_file.tail, notebook_file.head, e)
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            return False
+
+        with self._lock:
+            self._done_count += 1
+            logging.info('Downloaded %s into %s (%s) [%d/%d]',
+                         notebook_file.tail, notebook_file.head,
+                         format_bytes(size), self._done_count,
+                         self._file_count)
+        return True
@@ -0,0 +1,179 @@
+"""
+This module contains a store for contents of pages (supplement
+instructions, quizzes and so on) that would otherwise be carried around
+in memory after IN_MEMORY_MARKER or IN_MARKUP_MARKER. Pages are kept in
+compressed files and referenced by handles, their contents are read only
+when the page is actually saved.
+"""
+
+import os
+import gzip
+import time
+import hashlib
+import logging
+import threading
+
+from define import (PATH_PAGES, IN_STORE_MARKER, IN_MEMORY_MARKER,
+                    IN_MARKUP_MARKER)
+from utils import mkdir_p, clean_filename
+
+#: Pages that have not been used for this number of seconds are removed
+PAGE_MAX_AGE = 30 * 24 * 3600
+
+
+def is_page_handle(url):
+    """
+    Check whether URL is actually a handle of a page in a page store.
+    """
+    return url.startswith(IN_STORE_MARKER)
+
+
+def open_page(handle):
+    """
+    Open page referenced by handle for reading.
+
+    @param handle: Page handle as returned by PageStore.put.
+    @type handle: str
+
+    @return: Text file object.
+    @rtype: file
+    """
+    return gzip.open(handle[len(IN_STORE_MARKER):], 'rt', encoding='utf-8')
+
+
+def page_exists(handle):
+    """
+    Check whether page referenced by handle is still in the store.
+    """
+    return os.path.exists(handle[len(IN_STORE_MARKER):])
+
+
+def load_page(url):
+    """
+    Put contents of a stored page back into its URL, the opposite of
+    PageStore.spill. Other URLs are returned unchanged.
+
+    @param url: URL of a resource.
+    @type url: str
+
+    @rtype: str
+    """
+    if is_page_handle(url):
+        with open_page(url) as file_object:
+            return IN_MEMORY_MARKER + file_object.read()
+
+    if url.startswith(IN_MARKUP_MARKER):
+        handle = url[len(IN_MARKUP_MARKER):]
+        if is_page_handle(handle):
+            with open_page(handle) as file_object:
+                return IN_MARKUP_MARKER + file_object.read()
+
+    return url
+
+
+def load_pages(modules):
+    """
+    Replace handles of stored pages in modules with their contents, so
+    that modules do not depend on the page store.
+
+    @param modules: Modules, @see extractors.collect_modules
+    @type modules: list
+
+    @return: Modules with contents of pages in their URLs.
+    @rtype: list
+    """
+    return [
+        (module, [
+            (section, [
+                (lecture, dict(
+                    (fmt, [(load_page(url), title)
+                           for url, title in resources])
+                    for fmt, resources in links.items()))
+                for lecture, links in lectures])
+            for section, lectures in sections])
+        for module, sections in modules]
+
+
+class PageStore(object):
+    """
+    Content-addressed store of pages. Equal pages are stored only once.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        mkdir_p(self._path, 0o700)
+
+    @staticmethod
+    def of_course(class_name, path=PATH_PAGES):
+        """
+        Get page store of a course.
+
+        @param class_name: Course name (slug).
+        @type class_name: str
+
+        @rtype: PageStore
+        """
+        return PageStore(os.path.join(path, clean_filename(class_name)))
+
+    def put(self, content):
+        """
+        Store page contents.
+
+        @param content: Page contents.
+        @type content: str
+
+        @return: Handle that may be used instead of URL of the page.
+        @rtype: str
+        """
+        data = content.encode('utf-8')
+        filename = os.path.join(
+            self._path, hashlib.sha1(data).hexdigest() + '.html.gz')
+
+        if os.path.exists(filename):
+            # Mark page as recently used
+            os.utime(filename, None)
+        else:
+            temp_filename = '%s.%s.tmp' % (
+                filename, threading.current_thread().ident)
+            with gzip.open(temp_filename, 'wb') as file_object:
+                file_object.write(data)
+            os.replace(temp_filename, filename)
+
+        return IN_STORE_MARKER + filename
+
+    def spill(self, url):
+        """
+        Move contents of a page out of its URL into the store. Rendered
+        pages (IN_MEMORY_MARKER) are replaced with their handles, markup
+        of pages that are not rendered yet (IN_MARKUP_MARKER) is replaced
+        with its handle after IN_MARKUP_MARKER. Other URLs are returned
+        unchanged.
+
+        @param url: URL of a resource.
+        @type url: str
+
+        @rtype: str
+        """
+        if url.startswith(IN_MEMORY_MARKER):
+            return self.put(url[len(IN_MEMORY_MARKER):])
+
+        if url.startswith(IN_MARKUP_MARKER):
+            markup = url[len(IN_MARKUP_MARKER):]
+            if not is_page_handle(markup):
+                return IN_MARKUP_MARKER + self.put(markup)
+
+        return url
+
+    def prune(self, max_age):
+        """
+        Remove pages that have not been used for max_age seconds.
+        """
+        deadline = time.time() - max_age
+        for filename in os.listdir(self._path):
+            filename = os.path.join(self._path, filename)
+            try:
+                if os.path.getmtime(filename) < deadline:
+                    os.remove(filename)
+                    logging.debug('Removed unused page %s', filename)
+            except OSError:
+                pass
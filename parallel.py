@@ -1,8 +1,21 @@
+import os
 import abc
+import copy
+import sys
+import time
+import queue
+import asyncio
 import logging
+import threading
 import traceback
+import multiprocessing
+from contextlib import contextmanager
 from multiprocessing.dummy import Pool
 
+import requests
+
+from downloaders import DownloadOutcome, THROTTLING_CODES, format_bytes
+
 
 class AbstractDownloader(object):
     """
@@ -66,3 +79,564 @@ class ParallelDownloader(AbstractDownloader):
     def join(self):
         self._pool.close()
         self._pool.join()
+
+
+class ConcurrencyController(object):
+    """
+    AIMD controller of the number of downloads in flight. Decisions are
+    made once per round, that is after as many downloads have completed as
+    the current limit allows to run at once:
+
+      - if replies asked to slow down (429, 503) or many downloads
+        failed for transient reasons (connection errors, 5xx replies),
+        the limit is halved; missing resources (other 4xx replies) do
+        not count;
+      - if the previous round raised the limit and aggregate throughput
+        has not grown noticeably, the limit is lowered by one and kept
+        there for a round (the link is saturated);
+      - otherwise the limit is raised by one.
+
+    The limit therefore oscillates around the smallest level that still
+    gives the best aggregate throughput. Time that downloads spend waiting
+    before retries is not counted against throughput, and downloads of
+    missing resources are not part of a round at all.
+    """
+
+    #: Share of failed downloads in a round above which the limit is halved
+    MAX_ERROR_RATE = 0.2
+
+    #: Relative growth of throughput that justifies a raised limit
+    MIN_GAIN = 0.05
+
+    def __init__(self, initial=2, minimum=1, maximum=32):
+        """
+        @param initial: Initial number of downloads in flight.
+        @type initial: int
+
+        @param minimum: Lowest number of downloads in flight.
+        @type minimum: int
+
+        @param maximum: Highest number of downloads in flight.
+        @type maximum: int
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self._condition = threading.Condition()
+
+        self.limit = max(minimum, min(initial, maximum))
+        self._in_flight = 0
+        self._last_action = None
+        self._last_throughput = None
+        self._start_round()
+
+        #: Decisions made so far, @see _decide
+        self.decisions = []
+
+    def _start_round(self):
+        self._round_start = time.time()
+        self._round_bytes = 0
+        self._round_wait = 0
+        self._round_speeds = []
+        self._round_errors = 0
+        self._round_throttled = 0
+        self._round_count = 0
+
+    def acquire(self):
+        """
+        Wait until another download may start.
+        """
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, size, elapsed, result=None):
+        """
+        Report a completed download and let another one start.
+
+        @param size: Number of bytes downloaded.
+        @type size: int
+
+        @param elapsed: Duration of the download in seconds.
+        @type elapsed: float
+
+        @param result: Result of the file downloader: its outcome, an
+            exception it raised or None if it reports nothing.
+        @type result: downloaders.DownloadOutcome or Exception
+        """
+        status_code, throttled, retry_wait = self._classify(result)
+        with self._condition:
+            self._in_flight -= 1
+            self._round_wait += retry_wait
+            self._round_throttled += throttled
+            if status_code is not None and 400 <= status_code < 500 and \
+                    status_code not in THROTTLING_CODES:
+                # Missing resource, it says nothing about the link
+                self._condition.notify_all()
+                return
+
+            self._round_count += 1
+            self._round_bytes += size
+            if elapsed - retry_wait > 0:
+                self._round_speeds.append(size / (elapsed - retry_wait))
+            if status_code is None or status_code >= 500:
+                self._round_errors += 1
+
+            if self._round_count >= self.limit:
+                self._decide()
+                self._start_round()
+            self._condition.notify_all()
+
+    @staticmethod
+    def _classify(result):
+        """
+        Get the final HTTP code of a download, the number of replies that
+        asked to slow down and the time spent waiting before retries.
+
+        @return: Tuple of (int, int, float), the code is 200 for downloads
+            that are not known to have failed and None for failures
+            without a reply (e.g. connection errors).
+        @rtype: (int, int, float)
+        """
+        if isinstance(result, DownloadOutcome):
+            status_code = 200 if result.succeeded else result.status_code
+            return status_code, result.throttled, result.retry_wait
+        if isinstance(result, requests.exceptions.HTTPError):
+            status_code = getattr(result.response, 'status_code', None)
+            return status_code, int(status_code in THROTTLING_CODES), 0
+        if isinstance(result, requests.exceptions.RequestException):
+            return None, 0, 0
+        return 200, 0, 0
+
+    def _decide(self):
+        # A download waiting before a retry holds one of limit slots
+        elapsed = max(time.time() - self._round_start -
+                      self._round_wait / float(self.limit), 1e-3)
+        throughput = self._round_bytes / elapsed
+        speeds = sorted(self._round_speeds)
+        speed = speeds[len(speeds) // 2] if speeds else 0
+        error_rate = float(self._round_errors) / self._round_count
+
+        limit = self.limit
+        if self._round_throttled or error_rate > self.MAX_ERROR_RATE:
+            action = 'decrease'
+            limit = limit // 2
+        elif self._last_action == 'increase' and \
+                throughput < self._last_throughput * (1 + self.MIN_GAIN):
+            action = 'back off'
+            limit -= 1
+        elif self._last_action == 'back off':
+            action = 'hold'
+        else:
+            action = 'increase'
+            limit += 1
+        limit = max(self.minimum, min(limit, self.maximum))
+
+        logging.info('Adaptive jobs: %d -> %d (%s), %s/s aggregate, '
+                     '%s/s per download, %d errors, %d throttled',
+                     self.limit, limit, action, format_bytes(throughput),
+                     format_bytes(speed), self._round_errors,
+                     self._round_throttled)
+        self.decisions.append({'time': time.time(),
+                               'action': action,
+                               'old_limit': self.limit,
+                               'limit': limit,
+                               'throughput': throughput,
+                               'speed': speed,
+                               'errors': self._round_errors,
+                               'throttled': self._round_throttled})
+
+        self.limit = limit
+        self._last_action = action
+        self._last_throughput = throughput
+
+    def metrics(self):
+        """
+        Summarize decisions made so far.
+
+        @return: Number of rounds, final and average limit, best aggregate
+            throughput in bytes per second and numbers of decisions by
+            action.
+        @rtype: dict
+        """
+        with self._condition:
+            decisions = list(self.decisions)
+        actions = {}
+        for decision in decisions:
+            actions[decision['action']] = \
+                actions.get(decision['action'], 0) + 1
+        return {
+            'rounds': len(decisions),
+            'limit': self.limit,
+            'average_limit': (sum(d['limit'] for d in decisions) /
+                              float(len(decisions))
+                              if decisions else self.limit),
+            'best_throughput': max([d['throughput'] for d in decisions] or
+                                   [0]),
+            'actions': actions,
+        }
+
+
+class AdaptiveDownloader(AbstractDownloader):
+    """
+    This class runs download requests in parallel like ParallelDownloader,
+    but the number of downloads in flight is chosen by a
+    ConcurrencyController from measured throughput and errors.
+    """
+    def __init__(self, file_downloader, controller=None):
+        super(AdaptiveDownloader, self).__init__(file_downloader)
+        self.controller = controller or ConcurrencyController()
+        self._pool = Pool(processes=self.controller.maximum)
+
+    def download(self, callback, url, *args, **kwargs):
+        callback_wrapper = lambda payload: callback(*payload)
+        return self._pool.apply_async(
+            self._download_measured, (url,) + args, kwargs,
+            callback=callback_wrapper)
+
+    def join(self):
+        self._pool.close()
+        self._pool.join()
+
+        metrics = self.controller.metrics()
+        logging.info('Adaptive jobs: %d rounds, settled at %d (average '
+                     '%.1f), best throughput %s/s, decisions %s',
+                     metrics['rounds'], metrics['limit'],
+                     metrics['average_limit'],
+                     format_bytes(metrics['best_throughput']),
+                     metrics['actions'])
+
+    def _download_measured(self, url, filename, resume=False):
+        """
+        Download a file when the controller allows it and report its size,
+        duration and outcome back.
+        """
+        size_before = os.path.getsize(filename) \
+            if resume and os.path.exists(filename) else 0
+
+        self.controller.acquire()
+        start = time.time()
+        size = 0
+        result = None
+        try:
+            _, result = self._download_wrapper(url, filename, resume)
+            if os.path.exists(filename):
+                size = max(os.path.getsize(filename) - size_before, 0)
+        finally:
+            self.controller.release(size, time.time() - start, result)
+        return url, result
+
+
+#: File downloader of a worker process of ProcessDownloader
+_worker_downloader = None
+
+
+def _init_download_worker(file_downloader):
+    global _worker_downloader
+    _worker_downloader = file_downloader
+
+
+def _download_in_worker(url, *args, **kwargs):
+    """
+    Counterpart of AbstractDownloader._download_wrapper that runs in a
+    worker process of ProcessDownloader.
+    """
+    try:
+        return url, _worker_downloader.download(url, *args, **kwargs)
+    except Exception as e:
+        logging.error("ProcessDownloader: %s", traceback.format_exc())
+        return url, e
+
+
+def get_portable_session(session):
+    """
+    Copy a requests session so that it can be sent to another process.
+    Cookies are copied into a plain jar, because jars loaded from browsers
+    may hold locks and cannot be pickled.
+
+    @param session: Requests session.
+    @type session: requests.Session
+
+    @return: Picklable copy of the session.
+    @rtype: requests.Session
+    """
+    state = session.__getstate__()
+    state['cookies'] = requests.cookies.merge_cookies(
+        requests.cookies.RequestsCookieJar(), session.cookies)
+    portable_session = requests.Session()
+    portable_session.__setstate__(state)
+    return portable_session
+
+
+class ProcessDownloader(AbstractDownloader):
+    """
+    This class runs download requests in a pool of worker processes, so
+    that reading and decrypting of replies is not limited to one core by
+    the GIL. Every worker gets a copy of the file downloader with the
+    cookies of its session. Callbacks are called in a thread of this
+    process.
+    """
+    def __init__(self, file_downloader, processes=1):
+        super(ProcessDownloader, self).__init__(file_downloader)
+        worker_downloader = copy.copy(file_downloader)
+        worker_downloader.session = get_portable_session(
+            file_downloader.session)
+
+        # Workers are spawned for the same reason as in process_pool
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            processes=processes, initializer=_init_download_worker,
+            initargs=(worker_downloader,))
+
+    def download(self, callback, url, *args, **kwargs):
+        callback_wrapper = lambda payload: callback(*payload)
+        # Results that cannot be sent back (e.g. unpicklable exceptions)
+        # are reported to the callback as errors
+        error_callback = lambda e: callback(url, e)
+        return self._pool.apply_async(
+            _download_in_worker, (url,) + args, kwargs,
+            callback=callback_wrapper, error_callback=error_callback)
+
+    def join(self):
+        self._pool.close()
+        self._pool.join()
+
+
+class AsyncDownloader(AbstractDownloader):
+    """
+    This class runs download requests concurrently on an asyncio event loop
+    in a single background thread. It downloads files itself with aiohttp
+    (which is imported only when the class is used), using cookies and
+    headers of the requests session of the file downloader. Other settings
+    of the session (mounted adapters, verify, proxies) and segments of the
+    file downloader are not used. Callbacks are called in the event loop
+    thread.
+    """
+
+    #: Number of attempts to download a file
+    MAX_ATTEMPTS = 3
+
+    #: Size of chunks written to files
+    CHUNK_SIZE = 65536
+
+    def __init__(self, file_downloader, concurrency=100):
+        """
+        @param file_downloader: Native downloader, only its session is used.
+        @type file_downloader: downloaders.NativeDownloader
+
+        @param concurrency: Maximum number of concurrent transfers.
+        @type concurrency: int
+
+        @raise ImportError: If aiohttp is not installed.
+        """
+        super(AsyncDownloader, self).__init__(file_downloader)
+        import aiohttp
+        self._aiohttp = aiohttp
+        self._session = file_downloader.session
+        if self._session.verify is not True or self._session.proxies or \
+                file_downloader.segments > 1:
+            logging.warning('--async-jobs ignores certificate verification '
+                            'and proxy settings of the session and '
+                            '--segments')
+        self._rate_limiter = file_downloader.rate_limiter
+        self._concurrency = concurrency
+        self._futures = []
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._client = asyncio.run_coroutine_threadsafe(
+            self._create_client(), self._loop).result()
+
+    async def _create_client(self):
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._aiohttp.ClientSession(
+            connector=self._aiohttp.TCPConnector(limit=self._concurrency),
+            headers=dict(self._session.headers),
+            timeout=self._aiohttp.ClientTimeout(sock_read=60,
+                                                sock_connect=30))
+
+    def download(self, callback, url, filename, resume=False):
+        future = asyncio.run_coroutine_threadsafe(
+            self._download_wrapper_async(callback, url, filename, resume),
+            self._loop)
+        self._futures.append(future)
+        return future
+
+    def join(self):
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+        asyncio.run_coroutine_threadsafe(
+            self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _download_wrapper_async(self, callback, url, filename, resume):
+        """
+        Asynchronous counterpart of _download_wrapper. Errors of aiohttp
+        are reported as requests exceptions, so that callbacks handle them
+        the same way as errors of the other downloaders.
+        """
+        async with self._semaphore:
+            try:
+                # Like downloaders.Downloader.download, None means that
+                # the download has been handled
+                await self._download(url, filename, resume)
+                result = None
+            except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result = requests.exceptions.ConnectionError(str(e))
+            except Exception as e:
+                logging.error("AsyncDownloader: %s", traceback.format_exc())
+                result = e
+        callback(url, result)
+        return result
+
+    async def _download(self, url, filename, resume):
+        """
+        Download url into filename, resuming partial files like
+        downloaders.NativeDownloader does.
+
+        @return: True if the file has been downloaded, False if the server
+            kept replying with errors.
+        @rtype: bool
+        """
+        error_msg = ''
+        for attempt in range(self.MAX_ATTEMPTS):
+            # resume has no meaning if the file doesn't exists!
+            resume = resume and os.path.exists(filename)
+            headers = self._get_cookie_headers(url)
+            if resume:
+                headers['Range'] = 'bytes={}-'.format(
+                    os.path.getsize(filename))
+                logging.info('Resume downloading %s -> %s', url, filename)
+            else:
+                logging.info('Downloading %s -> %s', url, filename)
+
+            async with self._client.get(url, headers=headers) as reply:
+                if resume and reply.status == 416:
+                    logging.info('%s already downloaded', filename)
+                    return True
+
+                if reply.status not in (200, 206):
+                    error_msg = '%s %s' % (reply.reason, reply.status)
+                    if attempt + 1 < self.MAX_ATTEMPTS:
+                        wait_interval = 2 ** (attempt + 1)
+                        logging.warning('Error %s downloading %s, will '
+                                        'retry in %d seconds', reply.status,
+                                        url, wait_interval)
+                        await asyncio.sleep(wait_interval)
+                    continue
+
+                # The server does not support partial downloads
+                append = resume and reply.status == 206
+                with open(filename, 'ab' if append else 'wb') as file_object:
+                    async for chunk in reply.content.iter_chunked(
+                            self.CHUNK_SIZE):
+                        file_object.write(chunk)
+                        if self._rate_limiter is not None:
+                            await asyncio.sleep(
+                                self._rate_limiter.reserve(len(chunk)))
+                return True
+
+        logging.warning('Skipping, can\'t download file ...')
+        logging.error(error_msg)
+        return False
+
+    def _get_cookie_headers(self, url):
+        """
+        Get Cookie header of the requests session for url.
+        """
+        request = requests.models.Request()
+        request.method = 'GET'
+        request.url = url
+        cookie_values = requests.cookies.get_cookie_header(
+            self._session.cookies, request)
+        return {'Cookie': cookie_values} if cookie_values else {}
+
+
+def iter_in_background(iterable, maxsize=16):
+    """
+    Consume iterable in a background thread and yield its items through a
+    bounded queue. This lets a slow producer (e.g. syllabus extraction) run
+    ahead of the consumer (e.g. downloader) by at most `maxsize` items.
+    Exceptions raised by the producer are re-raised in the consumer.
+
+    @param iterable: Iterable to consume.
+    @type iterable: iterable
+
+    @param maxsize: Maximum number of items waiting in the queue.
+    @type maxsize: int
+
+    @return: Generator of items of iterable.
+    @rtype: generator
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # Do not block forever if the consumer has gone away
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        try:
+            for item in iterable:
+                put((item, None))
+                if stopped.is_set():
+                    return
+        except BaseException:
+            put((done, sys.exc_info()[1]))
+        else:
+            put((done, None))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+@contextmanager
+def process_pool(processes):
+    """
+    Create a pool of worker processes that is shut down on exit from the
+    context. If processes is not positive, no pool is created and None is
+    returned instead.
+
+    Workers are spawned rather than forked, so that they do not inherit
+    locks held by other threads of this process (e.g. extraction threads).
+
+    @param processes: Number of worker processes.
+    @type processes: int
+
+    @return: Context manager that returns the pool.
+    @rtype: multiprocessing.Pool or None
+    """
+    if processes <= 0:
+        yield None
+        return
+
+    pool = multiprocessing.get_context('spawn').Pool(processes=processes)
+    try:
+        yield pool
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,157 @@
+"""
+This module contains the bandwidth limiter used by --max-rate. One token
+bucket is shared by every transfer of the run, including transfers of
+worker processes and segments of segmented downloads.
+"""
+
+import os
+import re
+import time
+import logging
+import multiprocessing
+
+from downloaders import format_bytes
+
+#: Lowest number of bytes that may be downloaded at once without waiting,
+#: so that small files are not slowed down by low rates
+MIN_BURST = 4 * 1024 * 1024
+
+#: Multipliers of rate suffixes
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(value):
+    """
+    Parse a rate given in bytes per second with an optional K, M or G
+    suffix, e.g. "20M".
+
+    @param value: Rate.
+    @type value: str
+
+    @return: Rate in bytes per second, 0 means unlimited.
+    @rtype: int
+
+    @raise ValueError: If value is not a rate.
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$', value,
+                     re.IGNORECASE)
+    if match is None:
+        raise ValueError('invalid rate "%s"' % value)
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()])
+
+
+class RateLimiter(object):
+    """
+    Token bucket that limits the aggregate download rate. The bucket holds
+    at most one second of the rate (and at least MIN_BURST bytes), so that
+    small files are downloaded at full speed while long transfers are held
+    to the rate.
+
+    The state of the bucket lives in shared memory, so a limiter passed to
+    worker processes keeps limiting the whole run. The rate may be changed
+    while downloading by writing a new rate into the control file.
+    """
+
+    #: Number of seconds between checks of the control file
+    CONTROL_INTERVAL = 1.0
+
+    def __init__(self, rate, control_filename=None):
+        """
+        @param rate: Rate in bytes per second, 0 means unlimited.
+        @type rate: int
+
+        @param control_filename: File to read new rates from, @see
+            parse_rate.
+        @type control_filename: str
+        """
+        # rate, tokens, time of last refill, time of last control check,
+        # modification time of the control file; created in the context
+        # of parallel.process_pool and parallel.ProcessDownloader
+        self._state = multiprocessing.get_context('spawn').Array(
+            'd', [rate, self._get_capacity(rate), time.time(), 0, 0])
+        self._control_filename = control_filename
+
+    @property
+    def rate(self):
+        return self._state[0]
+
+    def set_rate(self, rate):
+        """
+        Change the rate, the bucket is refilled to the new capacity.
+
+        @param rate: Rate in bytes per second, 0 means unlimited.
+        @type rate: int
+        """
+        with self._state.get_lock():
+            self._set_rate(rate)
+
+    def _set_rate(self, rate):
+        if rate != self._state[0]:
+            if rate > 0:
+                logging.info('Download rate limit: %s/s', format_bytes(rate))
+            else:
+                logging.info('Download rate limit: unlimited')
+        self._state[0] = rate
+        self._state[1] = self._get_capacity(rate)
+        self._state[2] = time.time()
+
+    def consume(self, size):
+        """
+        Take size bytes from the bucket, waiting until they are available.
+
+        @param size: Number of bytes that have been downloaded.
+        @type size: int
+        """
+        delay = self.reserve(size)
+        if delay > 0:
+            time.sleep(delay)
+
+    def reserve(self, size):
+        """
+        Take size bytes from the bucket without waiting. The bucket may go
+        into debt, which is paid back by waiting for the returned delay.
+
+        @param size: Number of bytes that have been downloaded.
+        @type size: int
+
+        @return: Number of seconds to wait before downloading more.
+        @rtype: float
+        """
+        with self._state.get_lock():
+            now = time.time()
+            self._check_control_file(now)
+
+            rate = self._state[0]
+            if rate <= 0:
+                return 0
+
+            tokens = min(self._state[1] + (now - self._state[2]) * rate,
+                         self._get_capacity(rate)) - size
+            self._state[1] = tokens
+            self._state[2] = now
+        return -tokens / rate if tokens < 0 else 0
+
+    def _check_control_file(self, now):
+        if self._control_filename is None or \
+                now - self._state[3] < self.CONTROL_INTERVAL:
+            return
+        self._state[3] = now
+
+        try:
+            mtime = os.path.getmtime(self._control_filename)
+            if mtime == self._state[4]:
+                return
+            self._state[4] = mtime
+            with open(self._control_filename) as file_object:
+                rate = parse_rate(file_object.read())
+        except (IOError, OSError):
+            return
+        except ValueError as e:
+            logging.warning('Ignoring %s: %s', self._control_filename, e)
+            return
+        self._set_rate(rate)
+
+    @staticmethod
+    def _get_capacity(rate):
+        return max(rate, MIN_BURST)
+
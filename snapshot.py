@@ -0,0 +1,179 @@
+"""
+This module contains syllabus snapshots that make incremental syncing of
+courses possible. A snapshot remembers every syllabus item of a course
+along with links extracted from it, so that on the next run only new or
+changed items need to be extracted again.
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+
+from urllib.parse import urlparse, parse_qs
+
+from define import PATH_SNAPSHOTS, IN_MEMORY_MARKER, IN_MARKUP_MARKER
+from pagestore import is_page_handle, page_exists
+from utils import mkdir_p, clean_filename
+
+#: Version of snapshot format, snapshots of other versions are ignored
+SNAPSHOT_VERSION = 1
+
+#: Links are re-extracted if any of their signed URLs expires within
+#: this number of seconds
+EXPIRES_MARGIN = 3600
+
+
+def get_fingerprint(item_json):
+    """
+    Compute fingerprint of a syllabus item JSON. Fingerprint changes when
+    anything in the item (name, slug, content summary, ...) changes.
+
+    @param item_json: Item JSON from onDemandCourseMaterialItems.v2.
+    @type item_json: dict
+
+    @rtype: str
+    """
+    dump = json.dumps(item_json, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(dump).hexdigest()
+
+
+def links_expired(links, margin=EXPIRES_MARGIN):
+    """
+    Check whether any of the links is a signed URL that is about to expire
+    (e.g. lecture video URLs) or a page that has been removed from its
+    page store.
+
+    @param links: Links, @see CourseraOnDemand._extract_links_from_text
+    @type links: dict
+
+    @rtype: bool
+    """
+    deadline = time.time() + margin
+    for resources in links.values():
+        for url, _title in resources:
+            # Markup of pages that are not rendered yet may be in a store
+            if url.startswith(IN_MARKUP_MARKER):
+                url = url[len(IN_MARKUP_MARKER):]
+                if not is_page_handle(url):
+                    continue
+            if is_page_handle(url):
+                if not page_exists(url):
+                    return True
+            elif not url.startswith(IN_MEMORY_MARKER):
+                expires = parse_qs(urlparse(url).query).get('Expires')
+                if expires and expires[0].isdigit() and \
+                        int(expires[0]) < deadline:
+                    return True
+    return False
+
+
+class SyllabusSnapshot(object):
+    """
+    Snapshot of extracted syllabus items of a course. Items are stored
+    by their id along with their type name, slug, fingerprint and links.
+    """
+
+    def __init__(self, filename, items=None):
+        self._filename = filename
+        self._old_items = items or {}
+        self._items = {}
+        self._lock = threading.Lock()
+
+        self.reused_count = 0
+        self.extracted_count = 0
+
+    @staticmethod
+    def load(class_name, options):
+        """
+        Load snapshot of a course. Snapshots are kept separately for
+        every set of options that affect extracted links.
+
+        @param class_name: Course name (slug).
+        @type class_name: str
+
+        @param options: Extraction options (resolution, languages, ...).
+        @type options: dict
+
+        @rtype: SyllabusSnapshot
+        """
+        options_hash = hashlib.sha1(
+            json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+        filename = os.path.join(PATH_SNAPSHOTS, '%s-%s.json.gz' % (
+            clean_filename(class_name), options_hash[:12]))
+
+        items = {}
+        try:
+            with gzip.open(filename, 'rt', encoding='utf-8') as file_object:
+                dom = json.load(file_object)
+            if dom.get('version') == SNAPSHOT_VERSION:
+                items = dom['items']
+                logging.info('Loaded syllabus snapshot with %d items',
+                             len(items))
+        except (IOError, OSError, ValueError, KeyError) as e:
+            logging.debug('Could not load syllabus snapshot %s: %s',
+                          filename, e)
+
+        return SyllabusSnapshot(filename, items)
+
+    def get_links(self, item_id, fingerprint):
+        """
+        Get links of an unchanged item.
+
+        @return: Links or None if the item is new, has changed or its links
+            have expired and it should be extracted again.
+        @rtype: dict or None
+        """
+        item = self._old_items.get(item_id)
+        if item is None or item['fingerprint'] != fingerprint:
+            return None
+
+        links = item['links']
+        if links_expired(links):
+            logging.debug('Links of %s have expired', item['slug'])
+            return None
+
+        with self._lock:
+            self._items[item_id] = item
+            self.reused_count += 1
+        return links
+
+    def put_links(self, item_id, fingerprint, type_name, slug, links):
+        """
+        Remember links that have just been extracted from an item. Links of
+        items that failed (None) are not remembered.
+        """
+        if links is None:
+            return
+
+        with self._lock:
+            self._items[item_id] = {'fingerprint': fingerprint,
+                                    'type_name': type_name,
+                                    'slug': slug,
+                                    'links': links}
+            self.extracted_count += 1
+
+    def keep_links(self, item_id):
+        """
+        Keep links of an item that has not been looked at in this run
+        (e.g. because of filters), so that they are not dropped on save.
+        """
+        item = self._old_items.get(item_id)
+        if item is not None:
+            with self._lock:
+                self._items[item_id] = item
+
+    def save(self):
+        """
+        Save items seen in this run. Items that are no longer present in
+        the syllabus are dropped.
+        """
+        mkdir_p(PATH_SNAPSHOTS, 0o700)
+        temp_filename = self._filename + '.tmp'
+        with gzip.open(temp_filename, 'wt', encoding='utf-8') as file_object:
+            json.dump({'version': SNAPSHOT_VERSION, 'items': self._items},
+                      file_object)
+        os.replace(temp_filename, self._filename)
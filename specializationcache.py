@@ -0,0 +1,106 @@
+"""
+This module contains the store of specialization lookups that is used by
+--specialization. Both specializations and names that turned out to be
+plain courses are remembered, so that repeated runs do not look them up
+again.
+"""
+
+import os
+import json
+import gzip
+import time
+import logging
+import threading
+
+from define import PATH_SPECIALIZATION_CACHE
+from utils import mkdir_p
+
+#: Version of cache file format, files of other versions are ignored
+SPECIALIZATION_CACHE_VERSION = 1
+
+
+class SpecializationCache(object):
+    """
+    Store of specialization lookups. Entries map a class name to the list
+    of courses of the specialization or to None if the name is not a
+    specialization.
+    """
+
+    def __init__(self, filename=PATH_SPECIALIZATION_CACHE,
+                 max_age=7 * 24 * 3600):
+        """
+        @param filename: File to keep cache in.
+        @type filename: str
+
+        @param max_age: Entries older than this number of seconds are
+            not used.
+        @type max_age: int
+        """
+        self._filename = filename
+        self._max_age = max_age
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def get(self, class_name):
+        """
+        Get remembered lookup result of a class name.
+
+        @return: Tuple of (bool, list), the bool tells whether the name
+            has been looked up recently, the list contains courses of the
+            specialization or is None if the name is not a specialization.
+        @rtype: (bool, [str])
+        """
+        entry = self._get_entries().get(class_name)
+        if entry is None or time.time() - entry['created'] > self._max_age:
+            return False, None
+        return True, entry['children']
+
+    def put(self, class_name, children):
+        """
+        Remember lookup result of a class name.
+
+        @param children: Courses of the specialization or None if the name
+            is not a specialization.
+        @type children: [str]
+        """
+        entries = self._get_entries()
+        with self._lock:
+            entries[class_name] = {'created': time.time(),
+                                   'children': children}
+
+    def save(self):
+        """
+        Save entries, expired entries are dropped.
+        """
+        deadline = time.time() - self._max_age
+        with self._lock:
+            entries = dict((class_name, entry)
+                           for class_name, entry
+                           in self._get_entries().items()
+                           if entry['created'] >= deadline)
+
+        mkdir_p(os.path.dirname(self._filename), 0o700)
+        temp_filename = '%s.%s.tmp' % (
+            self._filename, threading.current_thread().ident)
+        with gzip.open(temp_filename, 'wt', encoding='utf-8') as file_object:
+            json.dump({'version': SPECIALIZATION_CACHE_VERSION,
+                       'entries': entries}, file_object)
+        os.replace(temp_filename, self._filename)
+
+    def _get_entries(self):
+        if self._entries is not None:
+            return self._entries
+
+        entries = {}
+        try:
+            with gzip.open(self._filename, 'rt',
+                           encoding='utf-8') as file_object:
+                dom = json.load(file_object)
+            if dom.get('version') == SPECIALIZATION_CACHE_VERSION:
+                entries = dom['entries']
+        except (IOError, OSError, ValueError) as e:
+            logging.debug('Could not load specialization cache %s: %s',
+                          self._filename, e)
+
+        self._entries = entries
+        return entries
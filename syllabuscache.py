@@ -0,0 +1,129 @@
+"""
+This module contains the store of parsed course syllabuses that is used
+by --cache-syllabus. Cached syllabuses let resumed runs start downloading
+right away, without extracting the whole course again.
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+
+from define import PATH_SYLLABUS_CACHE
+from pagestore import PageStore
+from snapshot import links_expired
+from utils import mkdir_p, clean_filename
+
+#: Version of cache entry format, entries of other versions are ignored
+SYLLABUS_CACHE_VERSION = 1
+
+
+class SyllabusCache(object):
+    """
+    Store of parsed syllabuses (modules). Entries are kept per course and
+    per set of options that affect extraction, they are compressed and
+    written atomically. Page contents are kept in a PageStore of the
+    course and the cached modules only refer to them.
+    """
+
+    def __init__(self, path=PATH_SYLLABUS_CACHE, max_age=24 * 3600):
+        """
+        @param path: Directory to keep cache in.
+        @type path: str
+
+        @param max_age: Entries older than this number of seconds are
+            not used.
+        @type max_age: int
+        """
+        self._path = path
+        self._max_age = max_age
+
+    def load(self, class_name, options):
+        """
+        Load cached modules of a course.
+
+        @param class_name: Course name (slug).
+        @type class_name: str
+
+        @param options: Options that affect extraction.
+        @type options: dict
+
+        @return: Modules or None if there is no valid cache entry.
+        @rtype: list
+        """
+        filename = self._get_filename(class_name, options)
+        try:
+            with gzip.open(filename, 'rt', encoding='utf-8') as file_object:
+                entry = json.load(file_object)
+        except (IOError, OSError, ValueError) as e:
+            logging.debug('Could not load cached syllabus %s: %s',
+                          filename, e)
+            return None
+
+        if entry.get('version') != SYLLABUS_CACHE_VERSION:
+            logging.info('Cached syllabus has an old format, ignoring it')
+            return None
+
+        age = time.time() - entry['created']
+        if age > self._max_age:
+            logging.info('Cached syllabus is %d hours old, ignoring it',
+                         age // 3600)
+            return None
+
+        modules = entry['modules']
+        if any(links_expired(links)
+               for _module, sections in modules
+               for _section, lectures in sections
+               for _lecture, links in lectures):
+            logging.info('Cached syllabus contains expired links, '
+                         'ignoring it')
+            return None
+
+        logging.info('Using cached syllabus of %s', class_name)
+        return modules
+
+    def save(self, class_name, options, modules):
+        """
+        Save modules of a course. Contents of pages that are still kept
+        in memory are moved to the page store of the course.
+        """
+        pages = PageStore.of_course(class_name)
+
+        modules = [
+            (module, [
+                (section, [
+                    (lecture, dict(
+                        (fmt, [(pages.spill(url), title)
+                               for url, title in resources])
+                        for fmt, resources in links.items()))
+                    for lecture, links in lectures])
+                for section, lectures in sections])
+            for module, sections in modules]
+
+        entry = {'version': SYLLABUS_CACHE_VERSION,
+                 'created': time.time(),
+                 'class_name': class_name,
+                 'options': options,
+                 'modules': modules}
+
+        filename = self._get_filename(class_name, options)
+        temp_filename = '%s.%s.tmp' % (
+            filename, threading.current_thread().ident)
+        with gzip.open(temp_filename, 'wt', encoding='utf-8') as file_object:
+            json.dump(entry, file_object)
+        os.replace(temp_filename, filename)
+        logging.debug('Saved syllabus of %s to %s', class_name, filename)
+
+    def _get_course_path(self, class_name):
+        course_path = os.path.join(self._path, clean_filename(class_name))
+        mkdir_p(course_path, 0o700)
+        return course_path
+
+    def _get_filename(self, class_name, options):
+        options_hash = hashlib.sha1(
+            json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self._get_course_path(class_name),
+                            '%s.json.gz' % options_hash[:12])
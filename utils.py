@@ -15,6 +15,8 @@ import string
 import logging
 import datetime
 
+from collections import namedtuple
+from functools import lru_cache
 
 from bs4 import BeautifulSoup as BeautifulSoup_
 from xml.sax.saxutils import unescape as sax_unescape
@@ -35,6 +37,62 @@ from define import COURSERA_URL, WINDOWS_UNC_PREFIX
 def BeautifulSoup(page): return BeautifulSoup_(page, 'html.parser')
 
 
+#: Result of scan_markup: href attributes of <a> tags, attributes of <asset>
+#: tags and assetid attributes of <img> tags, in document order
+MarkupScan = namedtuple('MarkupScan', 'links asset_tags image_asset_ids')
+
+
+class _MarkupScanner(HTMLParser):
+    """
+    Streaming parser that collects links and assets of a markup text. It is
+    built on the same parser that BeautifulSoup is forced to use above, so
+    it sees exactly the same tags and attributes.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.links = []
+        self.asset_tags = []
+        self.image_asset_ids = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ('a', 'asset', 'img'):
+            return
+
+        # Attributes without value are empty strings in BeautifulSoup
+        attrs = dict((name, '' if value is None else value)
+                     for name, value in attrs)
+        if tag == 'a':
+            if 'href' in attrs:
+                self.links.append(attrs['href'])
+        elif tag == 'asset':
+            self.asset_tags.append(attrs)
+        elif attrs.get('assetid') is not None:
+            self.image_asset_ids.append(attrs['assetid'])
+
+
+@lru_cache(maxsize=64)
+def scan_markup(text):
+    """
+    Collect <a href> links, <asset> tags and <img assetid> references of
+    a markup (HTML) text in a single pass. Results are memoized, as the
+    same text is usually scanned several times during extraction.
+
+    @param text: Markup text.
+    @type text: str
+
+    @return: Links, asset tags and image asset ids. Asset tags are
+        dictionaries of their attributes and must not be modified.
+    @rtype: MarkupScan
+    """
+    scanner = _MarkupScanner()
+    scanner.feed(text)
+    scanner.close()
+    return MarkupScan(tuple(scanner.links),
+                      tuple(scanner.asset_tags),
+                      tuple(scanner.image_asset_ids))
+
+
 def spit_json(obj, filename):
     with open(filename, 'w') as file_object:
         json.dump(obj, file_object, indent=4)
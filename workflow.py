@@ -3,8 +3,10 @@ import re
 import abc
 import time
 import codecs
+import shutil
 import logging
 import subprocess
+from functools import partial
 
 import requests
 
@@ -12,7 +14,8 @@ from formatting import format_section, get_lecture_filename
 from playlist import create_m3u_playlist
 from utils import is_course_complete, mkdir_p, normalize_path
 from filtering import find_resources_to_get, skip_format_url
-from define import IN_MEMORY_MARKER
+from define import IN_MEMORY_MARKER, IN_MARKUP_MARKER
+from pagestore import is_page_handle, open_page
 
 
 def _iter_modules(modules, class_name, path, ignored_formats, args):
@@ -131,7 +134,13 @@ class CourseraDownloader(CourseDownloader):
                  class_name,
                  path='',
                  ignored_formats=None,
-                 disable_url_skipping=False):
+                 disable_url_skipping=False,
+                 renderer=None):
+        """
+        @param renderer: Converter that renders markup of pages that have
+            been extracted without rendering (IN_MARKUP_MARKER) into HTML.
+        @type renderer: api.MarkupToHTMLConverter
+        """
         super(CourseraDownloader, self).__init__()
 
         self._downloader = downloader
@@ -140,47 +149,66 @@ class CourseraDownloader(CourseDownloader):
         self._path = path
         self._ignored_formats = ignored_formats
         self._disable_url_skipping = disable_url_skipping
+        self._renderer = renderer
+        # Pages that are being rendered in the render pool
+        self._renderings = []
 
         self.skipped_urls = None if disable_url_skipping else []
         self.failed_urls = []
 
     def download_modules(self, modules):
+        """
+        Download resources of all given modules.
+
+        @param modules: Modules as returned by extractor. It may also be a
+            lazy structure produced by `extractors.group_lectures`, in which
+            case resources are downloaded while the syllabus is still being
+            extracted.
+        @type modules: iterable
+
+        @return: True if the course appears to be completed.
+        @rtype: bool
+        """
         completed = True
         modules = _iter_modules(
             modules, self._class_name, self._path,
             self._ignored_formats, self._args)
 
-        for module in modules:
-            last_update = -1
-            for section in module.sections:
-                if not os.path.exists(section.dir):
-                    mkdir_p(normalize_path(section.dir))
-
-                for lecture in section.lectures:
-                    for resource in lecture.resources:
-                        lecture_filename = normalize_path(
-                            lecture.filename(resource.fmt, resource.title))
-                        last_update = self._handle_resource(
-                            resource.url, resource.fmt, lecture_filename,
-                            self._download_completion_handler, last_update)
-
-                # After fetching resources, create a playlist in M3U format with the
-                # videos downloaded.
-                if self._args.playlist:
-                    create_m3u_playlist(section.dir)
-
-                if self._args.hooks:
-                    self._run_hooks(section, self._args.hooks)
-
-            # if we haven't updated any files in 1 month, we're probably
-            # done with this course
-            completed = completed and is_course_complete(last_update)
+        try:
+            for module in modules:
+                last_update = -1
+                for section in module.sections:
+                    if not os.path.exists(section.dir):
+                        mkdir_p(normalize_path(section.dir))
+
+                    for lecture in section.lectures:
+                        for resource in lecture.resources:
+                            lecture_filename = normalize_path(
+                                lecture.filename(resource.fmt, resource.title))
+                            last_update = self._handle_resource(
+                                resource.url, resource.fmt, lecture_filename,
+                                self._download_completion_handler, last_update)
+
+                    # After fetching resources, create a playlist in M3U
+                    # format with the videos downloaded.
+                    if self._args.playlist:
+                        create_m3u_playlist(section.dir)
+
+                    if self._args.hooks:
+                        self._run_hooks(section, self._args.hooks)
+
+                # if we haven't updated any files in 1 month, we're probably
+                # done with this course
+                completed = completed and is_course_complete(last_update)
+        finally:
+            # Wait for all pages to be rendered and downloads to complete,
+            # also if extracting the syllabus failed
+            for rendering in self._renderings:
+                rendering.wait()
+            self._downloader.join()
 
         if completed:
             logging.info('COURSE PROBABLY COMPLETE: ' + self._class_name)
-
-        # Wait for all downloads to complete
-        self._downloader.join()
         return completed
 
     def _download_completion_handler(self, url, result):
@@ -229,6 +257,15 @@ class CourseraDownloader(CourseDownloader):
                                  lecture_filename)
                     with codecs.open(lecture_filename, 'w', 'utf-8') as file_object:
                         file_object.write(page_content)
+                elif is_page_handle(url):
+                    logging.info('Saving page contents to: %s',
+                                 lecture_filename)
+                    with open_page(url) as page, \
+                            codecs.open(lecture_filename, 'w', 'utf-8') as file_object:
+                        shutil.copyfileobj(page, file_object)
+                elif url.startswith(IN_MARKUP_MARKER):
+                    self._save_rendered_page(url[len(IN_MARKUP_MARKER):],
+                                             lecture_filename)
                 else:
                     if self.skipped_urls is not None and skip_format_url(fmt, url):
                         self.skipped_urls.append(url)
@@ -247,6 +284,47 @@ class CourseraDownloader(CourseDownloader):
                               os.path.getmtime(lecture_filename))
         return last_update
 
+    def _save_rendered_page(self, markup, lecture_filename):
+        """
+        Render markup of a page into HTML and save it. Pages are rendered
+        only here, so that pages which are not saved are never rendered.
+        The page is saved when it has been rendered, while the following
+        resources are handled.
+
+        @param markup: Markup of the page or its handle in a page store.
+        @type markup: str
+
+        @param lecture_filename: File name to save the page to.
+        @type lecture_filename: str
+        """
+        logging.info('Rendering page contents to: %s', lecture_filename)
+        if is_page_handle(markup):
+            with open_page(markup) as page:
+                markup = page.read()
+
+        callback = partial(self._rendering_completion_handler,
+                           lecture_filename)
+        try:
+            rendering = self._renderer.render_async(markup, callback,
+                                                    lecture_filename)
+        except requests.exceptions.RequestException as e:
+            callback(e)
+            return
+
+        if rendering is not None:
+            self._renderings.append(rendering)
+
+    def _rendering_completion_handler(self, lecture_filename, result):
+        if isinstance(result, Exception):
+            logging.error('The following error has occurred while '
+                          'rendering page %s: %s', lecture_filename,
+                          str(result))
+            self.failed_urls.append(lecture_filename)
+            return
+
+        with codecs.open(lecture_filename, 'w', 'utf-8') as file_object:
+            file_object.write(result)
+
     def _run_hooks(self, section, hooks):
         original_dir = os.getcwd()
         for hook in hooks: